@@ -1,19 +1,175 @@
+import gc
+import importlib
+import io
+import json
+import logging
 import os
-import speech_recognition as sr
-from flask import Flask, request, render_template, redirect, url_for, send_file
+import sys
+import tempfile
+from flask import Flask, Request, request, render_template, redirect, url_for, send_file, jsonify, abort, Response
 from werkzeug.utils import secure_filename
-from pydub import AudioSegment
-from langdetect import detect
-from deep_translator import GoogleTranslator
-import pandas as pd
 import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from keyword_matcher import KeywordMatcher
+from fuzzy_matcher import FuzzyMatcher
+from transcription import create_backend, check_complete, transcribe_chunked
+from diarization import AGENT, MODES as DIARIZATION_MODES, MONO_AGENTS, diarize
+import audio_metrics
+from translation import TranslationCache, Translator, language_detector
+import reports
+from result_cache import ResultCache, file_digest, json_digest
+from store import AnalysisStore
+from jobs import JobQueue, QueueFull, StageTimer, DONE, FAILED, prune_finished, release_interrupted
+from metrics import Registry
+from live import LiveCall, LiveScorecard
+
+try:
+    from flask_sock import Sock
+except ImportError:  # Live scoring over WebSocket is optional: pip install flask-sock
+    Sock = None
+
+
+class UploadRequest(Request):
+    # Uploaded files are written into the upload folder as the request body
+    # is read, instead of being spooled to a temporary file that
+    # file.save() then copies, so a finished upload only has to be renamed
+    # into place (see save_upload). Files left unclaimed are removed when
+    # the request ends.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_paths = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = tempfile.NamedTemporaryFile('wb+', dir=app.config['UPLOAD_FOLDER'], prefix='upload-',
+                                             suffix='.part', delete=False)
+        self.upload_paths.append(stream.name)
+        return stream
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a'}
+# Databases and the result cache, kept out of the upload folder so that
+# nothing in them can be served with the recordings
+DATA_FOLDER = os.environ.get('DATA_FOLDER', 'data')
+os.makedirs(DATA_FOLDER, exist_ok=True)
+# Larger request bodies are refused with 413 before any of them is read
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', 200))
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Audio is normalized to what the recognizer works with before transcription
+RECOGNIZER_SAMPLE_RATE = 16000
+RECOGNIZER_SAMPLE_WIDTH = 2
+TRANSCRIBE_WORKERS = int(os.environ.get('TRANSCRIBE_WORKERS', 4))
+
+TRANSLATION_CACHE_PATH = os.path.join(DATA_FOLDER, 'translations.db')
+# Translation service: google, or fake (offline, returns the text unchanged)
+TRANSLATION_BACKEND = os.environ.get('TRANSLATION_BACKEND', 'google')
+
+# Reports are built per analysis on first download; they and the uploaded
+# recordings are removed by a background thread once older than REPORT_MAX_AGE
+REPORT_FOLDER = os.path.join(UPLOAD_FOLDER, 'reports')
+os.makedirs(REPORT_FOLDER, exist_ok=True)
+REPORT_MAX_AGE = float(os.environ.get('REPORT_MAX_AGE_HOURS', 24)) * 3600
+CLEANUP_INTERVAL = 600
+
+# Bump when a code change alters any stage's output, to invalidate cached results
+PIPELINE_VERSION = 3
+RESULT_CACHE_DIR = os.path.join(DATA_FOLDER, 'cache')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_MB', 1024)) * 1024 * 1024
+RESULT_CACHE_MAX_AGE = float(os.environ.get('RESULT_CACHE_MAX_AGE_DAYS', 30)) * 24 * 3600
+
+# Speech recognition engine: google, sphinx, vosk (offline) or fake (fixtures).
+# TRANSCRIPTION_CONCURRENCY caps simultaneous requests to the engine, and
+# TRANSCRIPTION_BATCH_SIZE sets how many chunks go to it at a time.
+TRANSCRIPTION_BACKEND = os.environ.get('TRANSCRIPTION_BACKEND', 'google')
+TRANSCRIPTION_CONCURRENCY = int(os.environ.get('TRANSCRIPTION_CONCURRENCY', 0)) or None
+TRANSCRIPTION_BATCH_SIZE = int(os.environ.get('TRANSCRIPTION_BATCH_SIZE', 0)) or None
+UNKNOWN_AUDIO_TEXT = "Could not understand the audio"
+SERVICE_ERROR_TEXT = "Error connecting to the speech recognition service"
+
+# Speaker separation before transcription, so only the agent's speech is
+# translated and scored: 'auto' splits dual-channel recordings by channel
+# (AGENT_CHANNEL, 0 = left) and single-channel ones by turn loudness,
+# 'stereo' only splits dual-channel recordings, 'off' scores the whole call.
+# DIARIZATION_MONO_AGENT picks the agent in single-channel recordings:
+# 'louder' or 'first' (the first to speak).
+DIARIZATION = os.environ.get('DIARIZATION', 'auto')
+AGENT_CHANNEL = int(os.environ.get('AGENT_CHANNEL', 0))
+DIARIZATION_MONO_AGENT = os.environ.get('DIARIZATION_MONO_AGENT', 'louder')
+if DIARIZATION not in DIARIZATION_MODES:
+    raise ValueError(f"Unknown DIARIZATION {DIARIZATION!r}, expected one of {', '.join(DIARIZATION_MODES)}")
+if AGENT_CHANNEL not in (0, 1):
+    raise ValueError(f"AGENT_CHANNEL must be 0 (left) or 1 (right), not {AGENT_CHANNEL}")
+if DIARIZATION_MONO_AGENT not in MONO_AGENTS:
+    raise ValueError(f"Unknown DIARIZATION_MONO_AGENT {DIARIZATION_MONO_AGENT!r}, "
+                     f"expected one of {', '.join(MONO_AGENTS)}")
+
+# Every scored call is kept here for the dashboard API
+ANALYSIS_DB_PATH = os.environ.get('ANALYSIS_DB_PATH', os.path.join(DATA_FOLDER, 'analyses.db'))
+
+# Background job settings: worker threads bound how many calls are processed
+# at once, the pending limit bounds how many uploads may wait for a worker
+JOB_DB_PATH = os.path.join(DATA_FOLDER, 'jobs.db')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 100))
+# How often each process looks for jobs released by server workers that exited
+JOB_RESUME_INTERVAL = 5
+
+def move_out_of_upload_folder(path):
+    # Earlier versions kept the databases and result cache in the upload
+    # folder; moves one to its place in the data folder on first start
+    legacy = os.path.join(UPLOAD_FOLDER, os.path.basename(path))
+    if os.path.exists(path) or not os.path.exists(legacy):
+        return
+    for suffix in ('-wal', '-shm', ''):  # The database file last, so it is only found once complete
+        if os.path.exists(legacy + suffix):
+            os.replace(legacy + suffix, path + suffix)
+
+for path in (TRANSLATION_CACHE_PATH, RESULT_CACHE_DIR, JOB_DB_PATH) + \
+        (() if 'ANALYSIS_DB_PATH' in os.environ else (ANALYSIS_DB_PATH,)):
+    move_out_of_upload_folder(path)
+
+# Pipeline metrics served on /metrics. TRACE_LOG additionally writes one JSON
+# line per job: '-' for stderr, anything else is a file to append to
+TRACE_LOG = os.environ.get('TRACE_LOG')
+METRICS = Registry()
+STAGE_SECONDS = METRICS.histogram('callanalysis_stage_seconds', "Time spent in each pipeline stage", ['stage'])
+JOB_SECONDS = METRICS.histogram('callanalysis_job_seconds', "Time from a job starting to finishing", ['status'])
+STAGE_BYTES = METRICS.counter('callanalysis_stage_bytes_total', "Bytes read and written by pipeline stages",
+                              ['stage', 'direction'])
+AUDIO_SECONDS = METRICS.histogram('callanalysis_audio_duration_seconds', "Duration of transcribed recordings",
+                                  buckets=(15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+TRANSCRIPT_SENTENCES = METRICS.histogram('callanalysis_transcript_sentences', "Sentences per transcript",
+                                         buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+EXTERNAL_CALLS = METRICS.counter('callanalysis_external_calls_total',
+                                 "Requests to the speech recognition and translation services",
+                                 ['service', 'backend', 'outcome'])
+CACHE_HITS = METRICS.counter('callanalysis_result_cache_hits_total', "Pipeline stages answered from the result cache",
+                             ['stage'])
+JOBS_PENDING = METRICS.gauge('callanalysis_jobs_pending', "Jobs queued or running")
+
+# How long the live endpoint waits for a frame before sending finished updates
+LIVE_POLL_SECONDS = 0.05
+# Audio the live endpoint accepts: sample rates in Hz, bytes per sample, channels
+LIVE_SAMPLE_RATES = (8000, 48000)
+LIVE_SAMPLE_WIDTHS = (1, 2)
+LIVE_CHANNELS = (1, 2)
+
+trace_logger = logging.getLogger('callanalysis.trace')
+if TRACE_LOG:
+    trace_logger.addHandler(logging.StreamHandler(sys.stderr) if TRACE_LOG == '-' else logging.FileHandler(TRACE_LOG))
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
 
 # Define the scorecard criteria and their weights
 SCORECARD_CRITERIA = {
@@ -56,59 +212,244 @@ KEYWORDS = {
     'Tone & Empathy': ['understand', 'appreciate', 'thank you', 'sorry to hear', 'assistance', 'help you']
 }
 
+# Scored from the recording's audio-quality metrics when there are any,
+# otherwise from its keywords like the other criteria
+AUDIO_CRITERION = 'Voice & Data'
+
+# Phrases that mark a call as outbound
+OUTBOUND_MARKERS = ['outbound', 'calling from']
+
+# Every keyword is compiled once into a single automaton so a transcript is
+# scanned once per call, however many criteria and keywords there are
+KEYWORD_MATCHER = KeywordMatcher([kw for kws in KEYWORDS.values() for kw in kws] + OUTBOUND_MARKERS)
+
+# 'exact' credits a keyword only when it is said word for word; 'fuzzy' also
+# accepts other word forms, misrecognized words and extra or missing words,
+# using an index of the keywords built here once
+KEYWORD_MATCHING = os.environ.get('KEYWORD_MATCHING', 'exact')
+if KEYWORD_MATCHING not in ('exact', 'fuzzy'):
+    raise ValueError(f"Unknown KEYWORD_MATCHING {KEYWORD_MATCHING!r}, expected 'exact' or 'fuzzy'")
+FUZZY_MATCHER = FuzzyMatcher(KEYWORD_MATCHER.phrases)
+
+NAME_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"my name is (\w+)",
+    r"this is (\w+)",
+    r"speaking with (\w+)"
+)]
+
+ACCOUNT_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"account (\d+)",
+    r"account number (\d+)",
+    r"account #(\d+)"
+)]
+
+def scorecard_fingerprint(criteria, keyword_table, fuzzy=None):
+    # Hash of what scoring depends on: the criteria, their keywords and, when
+    # matching fuzzily, every FuzzyMatcher setting
+    return json_digest(criteria, keyword_table, *(['fuzzy', fuzzy.fingerprint] if fuzzy else []))[:16]
+
+# Cached analyses and reports are keyed on this, so editing the scorecard
+# invalidates them without touching cached transcriptions; stored calls
+# record it as their scorecard_version, as rescore.py does
+SCORECARD_FINGERPRINT = scorecard_fingerprint(SCORECARD_CRITERIA, KEYWORDS,
+                                              FUZZY_MATCHER if KEYWORD_MATCHING == 'fuzzy' else None)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def convert_to_wav(filepath):
+def is_recognizer_ready(filepath, keep_channels=False):
+    try:
+        with wave.open(filepath, 'rb') as wav:
+            channels = wav.getnchannels()
+            return (channels in (1, 2) if keep_channels else channels == 1) and \
+                (wav.getframerate(), wav.getsampwidth()) == (RECOGNIZER_SAMPLE_RATE, RECOGNIZER_SAMPLE_WIDTH)
+    except (wave.Error, EOFError):
+        return False
+
+def convert_to_wav(filepath, keep_channels=False):
+    # Decodes the upload and returns it as a mono 16 kHz 16-bit WAV in memory,
+    # which is all the recognizer needs, without writing a WAV to disk. WAVs
+    # already in that format are returned as the path, untouched. With
+    # keep_channels, dual-channel recordings stay stereo for diarization.
+    if filepath.lower().endswith('.wav') and is_recognizer_ready(filepath, keep_channels):
+        return filepath
+    from pydub import AudioSegment
     audio = AudioSegment.from_file(filepath)
-    wav_path = filepath.rsplit('.', 1)[0] + '.wav'
-    audio.export(wav_path, format='wav')
-    return wav_path
-
-def transcribe_audio(filepath):
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(filepath) as source:
-        audio_data = recognizer.record(source)
+    channels = 2 if keep_channels and audio.channels == 2 else 1
+    audio = audio.set_channels(channels).set_frame_rate(RECOGNIZER_SAMPLE_RATE).set_sample_width(RECOGNIZER_SAMPLE_WIDTH)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setframerate(RECOGNIZER_SAMPLE_RATE)
+        wav.setsampwidth(RECOGNIZER_SAMPLE_WIDTH)
+        wav.writeframes(audio.raw_data)
+    buffer.seek(0)
+    return buffer
+
+transcription_backend = None
+transcription_backend_lock = threading.Lock()
+
+def get_transcription_backend():
+    # One shared instance so its concurrency limit applies across all jobs
+    global transcription_backend
+    with transcription_backend_lock:
+        if transcription_backend is None:
+            transcription_backend = create_backend(TRANSCRIPTION_BACKEND, max_concurrency=TRANSCRIPTION_CONCURRENCY,
+                                                   batch_size=TRANSCRIPTION_BATCH_SIZE)
+    return transcription_backend
+
+def transcribe_audio(audio):
+    return transcribe_audio_segments(audio)[0]
+
+def transcribe_audio_segments(audio):
+    # `audio` is a WAV path or file object, e.g. from convert_to_wav. Long
+    # recordings are split at pauses and the chunks transcribed in parallel;
+    # returns the stitched text and the per-chunk timestamps
+    segments = transcribe_chunked(audio, get_transcription_backend(), max_workers=TRANSCRIBE_WORKERS)
+    return stitch_segments(segments), segments
+
+def stitch_segments(segments):
+    text = ' '.join(segment['text'] for segment in segments if segment['text'])
+    if not text:
+        if any(segment['error'] for segment in segments):
+            return SERVICE_ERROR_TEXT
+        return UNKNOWN_AUDIO_TEXT
+    return text
+
+def transcribe_speakers(tracks):
+    # Transcribes each speaker's track at the same time. Returns the whole
+    # conversation as "Speaker: text" lines in time order, the segments
+    # labelled with their speaker, and the agent's text on its own.
+    with ThreadPoolExecutor(max_workers=len(tracks), thread_name_prefix='speaker') as pool:
+        futures = {speaker: pool.submit(transcribe_chunked, track, get_transcription_backend(), TRANSCRIBE_WORKERS)
+                   for speaker, track in tracks.items()}
+        segments = sorted(({**segment, 'speaker': speaker}
+                           for speaker, future in futures.items() for segment in future.result()),
+                          key=lambda segment: (segment['start'], segment['speaker']))
+    agent_text = stitch_segments([segment for segment in segments if segment['speaker'] == AGENT])
+    text = stitch_segments(segments)
+    if text not in (UNKNOWN_AUDIO_TEXT, SERVICE_ERROR_TEXT):
+        text = '\n'.join(f"{segment['speaker'].capitalize()}: {segment['text']}"
+                         for segment in segments if segment['text'])
+    return text, segments, agent_text
+
+def transcribe_call(filepath, timer=None):
+    # Converts and transcribes an upload, separating the speakers where the
+    # recording allows. Returns {'text', 'segments', 'agent_text',
+    # 'diarization', 'audio'}: the whole conversation, its chunks, the agent's
+    # speech that gets translated and scored, how the speakers were separated
+    # (None if they weren't, in which case agent_text is the whole call) and
+    # the audio-quality metrics from audio_metrics.measure. Raises
+    # IncompleteTranscription if any chunk failed, rather than return a
+    # transcript with parts of the call missing.
+    timer = timer or StageTimer()
+    with timer.stage('convert'):
+        audio = convert_to_wav(filepath, keep_channels=DIARIZATION != 'off')
+    file_size = os.path.getsize(filepath)
+    STAGE_BYTES.inc(file_size, stage='convert', direction='in')
+    STAGE_BYTES.inc(audio.getbuffer().nbytes if isinstance(audio, io.BytesIO) else file_size,
+                    stage='convert', direction='out')
+    with timer.stage('diarize'):
+        method, tracks, levels = diarize(audio, DIARIZATION, AGENT_CHANNEL, DIARIZATION_MONO_AGENT)
     try:
-        return recognizer.recognize_google(audio_data)
-    except sr.UnknownValueError:
-        return "Could not understand the audio"
-    except sr.RequestError:
-        return "Error connecting to the speech recognition service"
-
-def process_text(text):
-    sentences = text.split('.')
-    processed_data = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence:
-            try:
-                lang = detect(sentence)
-            except:
-                lang = "unknown"
-            
-            try:
-                translation = GoogleTranslator(source='auto', target='en').translate(sentence) if lang != 'en' else sentence
-            except:
-                translation = sentence
-                
-            processed_data.append((sentence, lang, translation))
-    return processed_data
-
-def analyze_call_with_scorecard(text):
+        with timer.stage('transcribe'):
+            if tracks:
+                text, segments, agent_text = transcribe_speakers(tracks)
+            else:
+                text, segments = transcribe_audio_segments(audio)
+                agent_text = text
+        record_transcription(segments)
+        check_complete(segments)
+        with timer.stage('audio_metrics'):
+            words = len(agent_text.split()) if agent_text not in (UNKNOWN_AUDIO_TEXT, SERVICE_ERROR_TEXT) else 0
+            metrics = audio_metrics.measure(levels, words, overlaps=method == 'stereo')
+    finally:
+        # The speaker tracks are temporary files, deleted when closed
+        for track in (tracks or {}).values():
+            track.close()
+    return {'text': text, 'segments': segments, 'agent_text': agent_text, 'diarization': method, 'audio': metrics}
+
+def call_key(filepath):
+    # Cache and store key of an upload: its audio plus every setting that
+    # changes what the transcription stage produces
+    return file_digest(filepath, PIPELINE_VERSION, TRANSCRIPTION_BACKEND, DIARIZATION, AGENT_CHANNEL,
+                       DIARIZATION_MONO_AGENT)
+
+translator = None
+translator_lock = threading.Lock()
+
+def get_translator():
+    global translator
+    with translator_lock:
+        if translator is None:
+            translator = Translator(TranslationCache(TRANSLATION_CACHE_PATH), client=TRANSLATION_BACKEND)
+    return translator
+
+def process_text(text, stats=None):
+    # Detection and translation results are cached and sentences in the same
+    # language are translated together; `stats` receives the cache hit ratio
+    # and time spent
+    sentences = [sentence.strip() for sentence in text.split('.') if sentence.strip()]
+    if not sentences:
+        return []
+    return get_translator().translate(sentences, stats)
+
+def score_transcript(text, audio=None):
+    # Numeric scorecard: identification fields and each criterion's score,
+    # all from a single scan of the transcript. With the call's audio metrics,
+    # AUDIO_CRITERION is scored from them and their issues are listed. In
+    # fuzzy mode, keywords not said word for word are looked for as well and
+    # listed under 'fuzzy_matches' with what was said and a confidence.
+    matches = KEYWORD_MATCHER.find(text)
+    fuzzy = {}
+    if KEYWORD_MATCHING == 'fuzzy':
+        fuzzy = FUZZY_MATCHER.find(text, skip=matches)
+        matches = {**fuzzy, **matches}
+    scorecard = {
+        'agent': extract_agent_name(text),
+        'call_type': "Outbound" if any(marker in matches for marker in OUTBOUND_MARKERS) else "Inbound",
+        'account': extract_account_number(text),
+        'scores': {criterion: calculate_criterion_score(text, KEYWORDS.get(criterion, []), weight, matches)
+                   for criterion, weight in SCORECARD_CRITERIA.items()},
+    }
+    if KEYWORD_MATCHING == 'fuzzy':
+        scorecard['fuzzy_matches'] = [
+            {'criterion': criterion, 'keyword': keyword, 'matched': fuzzy[keyword.lower()][0],
+             'confidence': fuzzy[keyword.lower()][1]}
+            for criterion, keywords in KEYWORDS.items() if criterion in SCORECARD_CRITERIA
+            for keyword in keywords if keyword.lower() in fuzzy]
+    if audio and AUDIO_CRITERION in SCORECARD_CRITERIA:
+        scorecard['audio_issues'] = audio_metrics.issues(audio)
+        scorecard['scores'][AUDIO_CRITERION] = score_audio(audio, SCORECARD_CRITERIA[AUDIO_CRITERION])
+    return scorecard
+
+def score_audio(metrics, max_score):
+    # Full score for clean audio, half with one issue, none with more
+    issues = len(audio_metrics.issues(metrics))
+    if issues == 0:
+        return max_score
+    elif issues == 1:
+        return max_score * 0.5
+    else:
+        return 0
+
+def analyze_call_with_scorecard(text, scorecard=None):
     analysis_data = []
     total_score = 0
     max_score = 100
     
+    if scorecard is None:
+        scorecard = score_transcript(text)
+    
     # Extract agent name, type of call, and account number for identification
-    agent_name = extract_agent_name(text)
-    call_type = "Outbound" if "outbound" in text.lower() or "calling from" in text.lower() else "Inbound"
-    account_number = extract_account_number(text)
+    agent_name = scorecard['agent']
+    call_type = scorecard['call_type']
+    account_number = scorecard['account']
     
     # Score each criterion
     for criterion, weight in SCORECARD_CRITERIA.items():
         keywords = KEYWORDS.get(criterion, [])
-        score = calculate_criterion_score(text, keywords, weight)
+        score = scorecard['scores'][criterion]
         
         # Special cases for information fields
         if criterion == 'Agent Name':
@@ -130,6 +471,13 @@ def analyze_call_with_scorecard(text):
                 comments = "Average"
             else:
                 comments = f"Needs improvement - Missing keywords: {', '.join(keywords)}"
+            if criterion == AUDIO_CRITERION and scorecard.get('audio_issues'):
+                comments = f"{comments.split(' - ')[0]} - Audio: {'; '.join(scorecard['audio_issues'])}"
+            elif score and scorecard.get('fuzzy_matches'):
+                fuzzy = [f"'{match['matched']}' for '{match['keyword']}' ({match['confidence']:.0%})"
+                         for match in scorecard['fuzzy_matches'] if match['criterion'] == criterion]
+                if fuzzy:
+                    comments = f"{comments} - Fuzzy match: {', '.join(fuzzy)}"
             score_value = f"{score}/{weight} ({int(percentage)}%)"
             total_score += score
         
@@ -146,39 +494,33 @@ def analyze_call_with_scorecard(text):
     
     return analysis_data, improvement_suggestions
 
-def extract_agent_name(text):
-    name_patterns = [
-        r"my name is (\w+)",
-        r"this is (\w+)",
-        r"speaking with (\w+)"
-    ]
-    
-    for pattern in name_patterns:
-        match = re.search(pattern, text.lower())
+def extract_agent_name(text, patterns=NAME_PATTERNS):
+    for pattern in patterns:
+        match = pattern.search(text)
         if match:
             return match.group(1).capitalize()
     return "Unknown"
 
-def extract_account_number(text):
-    account_patterns = [
-        r"account (\d+)",
-        r"account number (\d+)",
-        r"account #(\d+)"
-    ]
-    
-    for pattern in account_patterns:
-        match = re.search(pattern, text.lower())
+def extract_account_number(text, patterns=ACCOUNT_PATTERNS):
+    for pattern in patterns:
+        match = pattern.search(text)
         if match:
             return match.group(1)
     return "Not mentioned"
 
-def calculate_criterion_score(text, keywords, max_score):
+def calculate_criterion_score(text, keywords, max_score, matches=None):
     if max_score == 0:  # For information fields
         return 0
-        
-    text_lower = text.lower()
-    matches = sum(1 for keyword in keywords if keyword.lower() in text_lower)
     
+    # Use the caller's single scan of the transcript when it has one
+    if matches is None:
+        text_lower = text.lower()
+        match_count = sum(1 for keyword in keywords if keyword.lower() in text_lower)
+    else:
+        match_count = sum(1 for keyword in keywords if keyword.lower() in matches)
+    return score_from_match_count(match_count, max_score)
+
+def score_from_match_count(matches, max_score):
     # Calculate score based on keyword matches
     if matches == 0:
         return 0
@@ -246,175 +588,234 @@ def generate_improvement_suggestions(analysis_data):
     
     return suggestions[:5]  # Return top 5 suggestions
 
-def save_to_excel(data, analysis_data, improvement_suggestions, original_text, call_metadata=None):
-    # Create a timestamp for the report
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Create an Excel writer
-    excel_path = os.path.join(UPLOAD_FOLDER, 'call_analysis.xlsx')
-    writer = pd.ExcelWriter(excel_path, engine='xlsxwriter')
-    
-    # Get the workbook and create a format for headers
-    workbook = writer.book
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#D3D3D3',
-        'border': 1
-    })
-    
-    # Format for the overall score section
-    overall_format = workbook.add_format({
-        'bold': True,
-        'font_size': 14,
-        'align': 'center',
-        'valign': 'vcenter',
-        'bg_color': '#B8CCE4',
-        'border': 1
-    })
-    
-    # Create a cover sheet with call information
-    call_info_data = []
-    if call_metadata:
-        for key, value in call_metadata.items():
-            call_info_data.append([key, value])
+def save_to_excel(data, analysis_data, improvement_suggestions, original_text, call_metadata=None, excel_path=None,
+                  audio_quality=None):
+    excel_path = excel_path or os.path.join(REPORT_FOLDER, f"{uuid.uuid4().hex}.xlsx")
+    return reports.write_xlsx(excel_path, data, analysis_data, improvement_suggestions, original_text, call_metadata,
+                              audio_quality)
+
+analysis_store = None
+analysis_store_lock = threading.Lock()
+
+def get_analysis_store():
+    global analysis_store
+    with analysis_store_lock:
+        if analysis_store is None:
+            analysis_store = AnalysisStore(ANALYSIS_DB_PATH)
+    return analysis_store
+
+def save_analysis(call_key, scorecard, original_text, filename=None, audio=None):
+    if original_text in (UNKNOWN_AUDIO_TEXT, SERVICE_ERROR_TEXT):
+        return None  # Nothing was scored
+    total = sum(scorecard['scores'].values())
+    return get_analysis_store().save_call(
+        call_key, scorecard, SCORECARD_CRITERIA,
+        transcript=original_text,
+        filename=filename,
+        rating=get_rating(total),
+        scorecard_version=SCORECARD_FINGERPRINT,
+        audio_metrics=audio
+    )
+
+result_cache = None
+result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    global result_cache
+    with result_cache_lock:
+        if result_cache is None:
+            result_cache = ResultCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, max_age=RESULT_CACHE_MAX_AGE)
+    return result_cache
+
+def run_pipeline(filepath, filename, timer=None, job_id=None):
+    # Every stage's output is cached under a hash of the audio bytes, so a
+    # re-upload of the same recording skips straight to the result
+    timer = timer or StageTimer()
+    cache = get_result_cache()
+    audio_path = filepath  # Save path for playback
+    cache_hits = []
+
+    file_size = os.path.getsize(filepath)
+    STAGE_BYTES.inc(file_size, stage='upload', direction='in')
+    with timer.stage('hash'):
+        key = call_key(filepath)
+
+    transcript = cache.get_json(key, 'transcript.json')
+    if transcript:
+        cache_hits.append('transcribe')
     else:
-        call_info_data = [
-            ["Analysis Date", timestamp],
-            ["Analysis Type", "Call Quality Assessment"],
-            ["File Analyzed", call_metadata.get("filename", "Unknown")],
-        ]
-        
-        # Extract some basic metrics from the analysis data
-        for item in analysis_data:
-            if item[0] == "Agent Name":
-                call_info_data.append(["Agent", item[2].replace("Agent identified as: ", "")])
-            elif item[0] == "Type of call":
-                call_info_data.append(["Call Type", item[2].replace("Call type: ", "")])
-            elif item[0] == "Account number":
-                call_info_data.append(["Account", item[2].replace("Account mentioned: ", "")])
-            elif item[0] == "OVERALL SCORE":
-                call_info_data.append(["Overall Score", item[2]])
-    
-    # Add the full transcript
-    call_info_data.append(["Full Transcript", original_text])
-    
-    df_info = pd.DataFrame(call_info_data, columns=["Field", "Value"])
-    df_info.to_excel(writer, sheet_name='Call Information', index=False)
-    
-    # Format the Call Information sheet
-    worksheet = writer.sheets['Call Information']
-    worksheet.set_column('A:A', 20)
-    worksheet.set_column('B:B', 80)
-    
-    # Transcription Sheet
-    df_transcription = pd.DataFrame(data, columns=['Original Text', 'Detected Language', 'English Translation'])
-    df_transcription.to_excel(writer, sheet_name='Transcription', index=False)
-    
-    # Format the transcription sheet
-    worksheet = writer.sheets['Transcription']
-    worksheet.set_column('A:A', 50)
-    worksheet.set_column('B:B', 15)
-    worksheet.set_column('C:C', 50)
-    
-    # Apply header format
-    for col_num, value in enumerate(df_transcription.columns.values):
-        worksheet.write(0, col_num, value, header_format)
-    
-    # Scorecard Sheet
-    df_analysis = pd.DataFrame(analysis_data, columns=['Criterion', 'Score', 'Comments'])
-    
-    # Create special formatting for the scorecard
-    df_analysis.to_excel(writer, sheet_name='Scorecard', index=False)
-    worksheet = writer.sheets['Scorecard']
-    
-    # Format the scorecard sheet
-    worksheet.set_column('A:A', 30)
-    worksheet.set_column('B:B', 20)
-    worksheet.set_column('C:C', 50)
-    
-    # Apply header format
-    for col_num, value in enumerate(df_analysis.columns.values):
-        worksheet.write(0, col_num, value, header_format)
-    
-    # Apply conditional formatting to the scorecard sheet
-    excellent_format = workbook.add_format({'bg_color': '#C6EFCE'})  # Light green
-    good_format = workbook.add_format({'bg_color': '#FFEB9C'})       # Light yellow
-    needs_improvement_format = workbook.add_format({'bg_color': '#FFC7CE'})  # Light red
-    
-    # Add formats for each row based on the content
-    for i, row in enumerate(analysis_data):
-        criterion, score, comments = row
-        row_idx = i + 1  # +1 because we have a header row
-        
-        if criterion == "OVERALL SCORE":
-            # Merge cells and apply special format to overall score
-            worksheet.merge_range(row_idx, 0, row_idx, 2, f"OVERALL SCORE: {comments}", overall_format)
-        else:
-            # Apply conditional formatting based on the comments
-            if "Excellent" in comments:
-                for col in range(3):
-                    worksheet.write(row_idx, col, row[col], excellent_format)
-            elif "Good" in comments or "Average" in comments:
-                for col in range(3):
-                    worksheet.write(row_idx, col, row[col], good_format)
-            elif "Needs improvement" in comments:
-                for col in range(3):
-                    worksheet.write(row_idx, col, row[col], needs_improvement_format)
-    
-    # Improvement Plan Sheet
-    df_improvement = pd.DataFrame({'Suggestions for Improvement': improvement_suggestions})
-    df_improvement.to_excel(writer, sheet_name='Improvement Plan', index=False)
-    
-    # Format the improvement plan sheet
-    worksheet = writer.sheets['Improvement Plan']
-    worksheet.set_column('A:A', 80)
-    
-    # Apply header format
-    worksheet.write(0, 0, 'Suggestions for Improvement', header_format)
-    
-    # Create a reference sheet with script and scorecard information
-    script_data = [
-        ["Script Section", "Description", "Importance"],
-        ["Greeting", "Good morning/Afternoon/Good Evening, may I please speak to...", "Required"],
-        ["Call and Business Disclosure", "This call is being recorded for Quality and Security Purposes...", "Required (5%)"],
-        ["Authentication", "To ensure that I am speaking with the correct customer...", "Critical (20%)"],
-        ["Reason for the Call", "Mention the problem - missed/short payment, broken promise...", "Required"],
-        ["Obtaining reason for default", "Why did you fail to pay your instalment?", "Important (10%)"],
-        ["Negotiation", "Request payments in descending order: 100%, 30%, 10%", "Important (10%)"],
-        ["Forbearance", "Offer the forbs plan to account from D2D-D5D", "Important (10%)"],
-        ["NCA Disclaimer", "ABSA is legally required to provide an update of your credit record...", "Important (10%)"],
-        ["Payment Method", "Will you be paying via Cash deposit, internet banking...", "Required (5%)"],
-        ["CIF Confirmation", "Could we please confirm if we have your correct information?", "Important (10%)"],
-        ["Closing", "Recap the PTP date, amount, and payment method", "Required (5%)"]
-    ]
-    
-    df_script = pd.DataFrame(script_data[1:], columns=script_data[0])
-    df_script.to_excel(writer, sheet_name='Reference Guide', index=False)
-    
-    # Format the reference guide sheet
-    worksheet = writer.sheets['Reference Guide']
-    worksheet.set_column('A:A', 25)
-    worksheet.set_column('B:B', 60)
-    worksheet.set_column('C:C', 20)
-    
-    # Apply header format
-    for col_num, value in enumerate(df_script.columns.values):
-        worksheet.write(0, col_num, value, header_format)
-    
-    # Save the Excel file
-    writer.close()
-    
-    return excel_path
+        # Raises if any chunk failed, so only complete transcripts are cached
+        transcript = transcribe_call(filepath, timer)
+        cache.put_json(key, 'transcript.json', transcript)
+    original_text, segments = transcript['text'], transcript['segments']
+    # Only the agent's speech is translated, scored and stored
+    agent_text = transcript['agent_text']
+    audio = transcript['audio']
+
+    translation_stats = {}
+    processed_data = cache.get_json(key, 'processed.json')
+    if processed_data is not None:
+        cache_hits.append('process_text')
+    else:
+        with timer.stage('process_text'):
+            processed_data = process_text(agent_text, translation_stats)
+        # Sentences that failed to translate are kept as said; retry them next time
+        if not translation_stats.get('translate_failures'):
+            cache.put_json(key, 'processed.json', processed_data)
+        record_translation(processed_data, translation_stats)
+
+    analysis = cache.get_json(key, 'analysis.json', SCORECARD_FINGERPRINT)
+    if analysis:
+        cache_hits.append('analyze')
+        scorecard = analysis['scorecard']
+        analysis_data, improvement_suggestions = analysis['analysis_data'], analysis['improvement_suggestions']
+    else:
+        with timer.stage('analyze'):
+            scorecard = score_transcript(agent_text, audio)
+            analysis_data, improvement_suggestions = analyze_call_with_scorecard(agent_text, scorecard)
+        cache.put_json(key, 'analysis.json', {'scorecard': scorecard,
+                                              'analysis_data': analysis_data,
+                                              'improvement_suggestions': improvement_suggestions},
+                       SCORECARD_FINGERPRINT)
+
+    with timer.stage('store'):
+        save_analysis(key, scorecard, agent_text, filename, audio)
+    for stage in cache_hits:
+        CACHE_HITS.inc(stage=stage)
+
+    # The Excel report is only built when someone downloads it
+    call_metadata = {
+        "filename": filename,
+        "analysis_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "file_size": f"{file_size / 1024:.2f} KB",
+        "duration": f"{audio['duration_seconds']:.1f} seconds"
+    }
+
+    return {
+        'data': processed_data,
+        'analysis_data': analysis_data,
+        'improvement_suggestions': improvement_suggestions,
+        'report_id': job_id,
+        'call_metadata': call_metadata,
+        'audio_path': audio_path,
+        'original_text': original_text,
+        'agent_text': agent_text,
+        'diarization': transcript['diarization'],
+        'audio': audio,
+        'segments': segments,
+        'translation_stats': translation_stats,
+        'cache_key': key,
+        'scorecard': SCORECARD_FINGERPRINT,
+        'cache_hits': cache_hits,
+    }
+
+def record_transcription(segments):
+    # One recognizer request per chunk: ok, no speech recognized, or a service
+    # error, plus an error for each failed attempt that was retried
+    for segment in segments:
+        outcome = 'error' if segment['error'] else 'ok' if segment['text'] else 'no_speech'
+        EXTERNAL_CALLS.inc(service='transcription', backend=TRANSCRIPTION_BACKEND, outcome=outcome)
+        if segment.get('attempts', 1) > 1:
+            EXTERNAL_CALLS.inc(segment['attempts'] - 1, service='transcription', backend=TRANSCRIPTION_BACKEND,
+                               outcome='error')
+    if segments:
+        AUDIO_SECONDS.observe(segments[-1]['end'])
+
+def record_translation(processed_data, stats):
+    TRANSCRIPT_SENTENCES.observe(len(processed_data))
+    requests, failures = stats.get('translate_requests', 0), stats.get('translate_failures', 0)
+    if requests > failures:
+        EXTERNAL_CALLS.inc(requests - failures, service='translation', backend=TRANSLATION_BACKEND, outcome='ok')
+    if failures:
+        EXTERNAL_CALLS.inc(failures, service='translation', backend=TRANSLATION_BACKEND, outcome='error')
+
+def observe_stages(timings):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+def run_job(filepath, filename, timer, job_id):
+    # Job queue handler: runs the pipeline, then records the job's stage
+    # timings and, with TRACE_LOG set, a trace line with what it did
+    start = time.perf_counter()
+    result = error = None
+    try:
+        result = run_pipeline(filepath, filename, timer, job_id)
+        return result
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe_stages(timer.timings)
+        JOB_SECONDS.observe(seconds, status=FAILED if error else DONE)
+        if trace_logger.isEnabledFor(logging.INFO):
+            trace = {'event': 'job', 'job_id': job_id, 'filename': filename, 'status': FAILED if error else DONE,
+                     'error': error, 'seconds': round(seconds, 4), 'timings': timer.timings}
+            if result:
+                segments = result['segments']
+                trace.update(
+                    cache_hits=result['cache_hits'],
+                    audio_seconds=segments[-1]['end'] if segments else 0,
+                    chunks=len(segments),
+                    transcription_errors=sum(1 for segment in segments if segment['error']),
+                    sentences=len(result['data']),
+                    translation=result['translation_stats'],
+                )
+            trace_logger.info(json.dumps(trace))
+
+job_queue = None
+job_queue_lock = threading.Lock()
+# Whether this process frees the jobs interrupted by the last shutdown before
+# resuming them; a preloading server does that once, before forking workers
+release_jobs = True
+
+def get_job_queue():
+    # Created on first use so that scripts importing this module (e.g. batch.py
+    # worker processes) don't start job threads or resume queued uploads
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(JOB_DB_PATH, run_job, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_LIMIT,
+                                 release=release_jobs, resume_interval=JOB_RESUME_INTERVAL)
+            threading.Thread(target=cleanup_loop, name='cleanup', daemon=True).start()
+    return job_queue
+
+def enqueue_upload(file):
+    job_queue = get_job_queue()
+    job_id = job_queue.new_id()
+    filename = secure_filename(file.filename)
+    # Prefix with the job ID so concurrent uploads of the same name don't collide
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
+    save_upload(file, filepath)
+    return job_queue.submit(filepath, filename, job_id=job_id)
+
+def save_upload(file, filepath):
+    # Renames an upload UploadRequest already wrote to disk; anything else
+    # (e.g. a request built without it) is copied
+    stream = file.stream
+    if getattr(stream, 'name', None) in request.upload_paths:
+        stream.flush()
+        os.replace(stream.name, filepath)
+        request.upload_paths.remove(stream.name)
+    else:
+        file.save(filepath)
+
+@app.teardown_request
+def remove_unclaimed_uploads(error=None):
+    for path in request.upload_paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    if request.path == url_for('create_job'):
+        return jsonify(error=f"Uploads are limited to {MAX_UPLOAD_MB:g} MB"), 413
+    return error
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
-    data = None
-    analysis_data = None
-    improvement_suggestions = None
-    audio_path = None
-    excel_path = None
-    original_text = None
-    
     if request.method == 'POST':
         if 'file' not in request.files:
             return redirect(request.url)
@@ -422,59 +823,311 @@ def upload_file():
         if file.filename == '':
             return redirect(request.url)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            audio_path = filepath  # Save path for playback
-            
-            if not filename.endswith('.wav'):
-                filepath = convert_to_wav(filepath)
-            
-            original_text = transcribe_audio(filepath)
-            processed_data = process_text(original_text)
-            analysis_data, improvement_suggestions = analyze_call_with_scorecard(original_text)
-            
-            # Create call metadata
-            call_metadata = {
-                "filename": filename,
-                "analysis_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "file_size": f"{os.path.getsize(filepath) / 1024:.2f} KB",
-                "duration": "Unknown"  # Could calculate if needed
-            }
-            
-            excel_path = save_to_excel(
-                processed_data, 
-                analysis_data, 
-                improvement_suggestions, 
-                original_text,
-                call_metadata
+            try:
+                job_id = enqueue_upload(file)
+            except QueueFull:
+                abort(503)
+            return redirect(url_for('job_page', job_id=job_id))
+
+    return render_template('index.html',
+                          data=None,
+                          analysis_data=None,
+                          improvement_suggestions=None,
+                          audio_path=None,
+                          report_id=None,
+                          original_text=None)
+
+@app.route('/results/<job_id>')
+def job_page(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        abort(404)
+    result = job['result'] or {}
+    # A cached result can outlive its recording
+    audio_path = result.get('audio_path')
+    if audio_path and not os.path.isfile(audio_path):
+        audio_path = None
+    return render_template('index.html',
+                          job=job,
+                          data=result.get('data'),
+                          analysis_data=result.get('analysis_data'),
+                          improvement_suggestions=result.get('improvement_suggestions'),
+                          audio_path=audio_path,
+                          report_id=result.get('report_id'),
+                          original_text=result.get('original_text'))
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    file = request.files.get('file')
+    if not file or file.filename == '' or not allowed_file(file.filename):
+        return jsonify(error="Upload a WAV, MP3 or M4A file in the 'file' field"), 400
+    try:
+        job_id = enqueue_upload(file)
+    except QueueFull as e:
+        return jsonify(error=f"Job queue is full: {e}"), 503
+    return jsonify(job_id=job_id,
+                   status_url=url_for('job_status', job_id=job_id),
+                   result_url=url_for('job_result', job_id=job_id)), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job_queue().status(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    if job['status'] == FAILED:
+        return jsonify(status=job['status'], error=job['error']), 500
+    if job['status'] != DONE:
+        return jsonify(status=job['status'], stage=job['stage']), 409
+    return jsonify(status=job['status'], timings=job['timings'], **job['result'])
+
+def build_report(report_id):
+    # Builds the workbook for a finished analysis on first download. The report
+    # is also cached by audio hash so re-uploads of the recording reuse it.
+    job = get_job_queue().get(report_id)
+    if job is None or job['result'] is None:
+        return None
+    result = job['result']
+    report_path = os.path.join(REPORT_FOLDER, f"{report_id}.xlsx")
+    if os.path.exists(report_path):
+        return report_path
+
+    # Built under a temporary name and renamed so a concurrent download never
+    # serves a half-written file
+    cache = get_result_cache()
+    key, scorecard = result['cache_key'], result['scorecard']
+    tmp_path = os.path.join(REPORT_FOLDER, f".{report_id}-{uuid.uuid4().hex}.xlsx")
+    timer = StageTimer()
+    if cache.has(key, 'report.xlsx', scorecard):
+        CACHE_HITS.inc(stage='report')
+        shutil.copyfile(cache.path(key, 'report.xlsx', scorecard), tmp_path)
+    else:
+        with timer.stage('report'):
+            save_to_excel(
+                result['data'],
+                result['analysis_data'],
+                result['improvement_suggestions'],
+                result['original_text'],
+                result['call_metadata'],
+                excel_path=tmp_path,
+                audio_quality=result.get('audio')
             )
-            
-            return render_template('index.html', 
-                                  data=processed_data, 
-                                  analysis_data=analysis_data, 
-                                  improvement_suggestions=improvement_suggestions, 
-                                  excel_path=excel_path, 
-                                  audio_path=audio_path,
-                                  original_text=original_text)
-    
-    return render_template('index.html', 
-                          data=data, 
-                          analysis_data=analysis_data, 
-                          improvement_suggestions=improvement_suggestions, 
-                          audio_path=audio_path, 
-                          excel_path=excel_path,
-                          original_text=original_text)
-
-@app.route('/download_excel')
-def download_excel():
-    excel_path = os.path.join(UPLOAD_FOLDER, 'call_analysis.xlsx')
-    return send_file(excel_path, as_attachment=True, download_name='call_analysis.xlsx')
+        STAGE_BYTES.inc(os.path.getsize(tmp_path), stage='report', direction='out')
+        cache.put_file(key, 'report.xlsx', tmp_path, scorecard)
+    os.replace(tmp_path, report_path)
+    observe_stages(timer.timings)
+    return report_path
+
+@app.route('/download_excel/<report_id>')
+def download_excel(report_id):
+    report_path = build_report(report_id)
+    if report_path is None:
+        abort(404)
+    filename = get_job_queue().get(report_id)['filename']
+    return send_file(os.path.abspath(report_path), as_attachment=True,
+                     download_name=f"call_analysis_{filename.rsplit('.', 1)[0]}.xlsx")
+
+@app.route('/reports/<report_id>.<fmt>')
+def download_report(report_id, fmt):
+    # Scorecard as CSV, or the whole report as JSON, for machine consumers
+    if fmt not in ('csv', 'json'):
+        abort(404)
+    job = get_job_queue().get(report_id)
+    if job is None or job['result'] is None:
+        abort(404)
+    result = job['result']
+    body = reports.render(fmt, result['data'], result['analysis_data'], result['improvement_suggestions'],
+                          result['original_text'], result['call_metadata'], result.get('audio'))
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/json'
+    return Response(body, mimetype=mimetype)
+
+@app.route('/api/calls')
+def api_calls():
+    calls = get_analysis_store().calls(
+        agent=request.args.get('agent'),
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float),
+        limit=max(min(request.args.get('limit', 100, type=int), 1000), 1)
+    )
+    return jsonify(calls=calls)
+
+@app.route('/api/calls/<int:call_id>')
+def api_call(call_id):
+    call = get_analysis_store().call(call_id)
+    if call is None:
+        return jsonify(error="Unknown call"), 404
+    return jsonify(call)
+
+@app.route('/api/stats/criteria')
+def api_criterion_stats():
+    # Mean score per criterion per agent per ISO week (e.g. 2025-W07)
+    rows = get_analysis_store().criterion_weekly(
+        agent=request.args.get('agent'),
+        criterion=request.args.get('criterion'),
+        from_week=request.args.get('from_week'),
+        to_week=request.args.get('to_week')
+    )
+    return jsonify(rows=rows)
+
+@app.route('/api/stats/agents')
+def api_agent_stats():
+    rows = get_analysis_store().agent_weekly(
+        agent=request.args.get('agent'),
+        from_week=request.args.get('from_week'),
+        to_week=request.args.get('to_week')
+    )
+    return jsonify(rows=rows)
+
+def cleanup_loop():
+    # Removes reports, uploads and finished jobs older than REPORT_MAX_AGE and
+    # trims the result cache
+    while True:
+        cutoff = time.time() - REPORT_MAX_AGE
+        for folder in (REPORT_FOLDER, UPLOAD_FOLDER):
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    # Databases and rescore.py's hit matrix, if ANALYSIS_DB_PATH puts them here
+                    if os.path.isfile(path) and not name.endswith(('.db', '.db-wal', '.db-shm', '.npz')) \
+                            and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+        try:
+            prune_finished(JOB_DB_PATH, cutoff)
+        except sqlite3.Error:
+            pass
+        try:
+            get_result_cache().maybe_evict()
+        except OSError:
+            pass
+        time.sleep(CLEANUP_INTERVAL)
+
+def live_audio_format(args):
+    # (sample rate, sample width, channels) of a live call from its query
+    # string; raises ValueError for a format outside the LIVE_* limits
+    frame_rate = args.get('sample_rate', RECOGNIZER_SAMPLE_RATE, type=int)
+    sample_width = args.get('sample_width', RECOGNIZER_SAMPLE_WIDTH, type=int)
+    channels = args.get('channels', 1, type=int)
+    if not LIVE_SAMPLE_RATES[0] <= frame_rate <= LIVE_SAMPLE_RATES[1]:
+        raise ValueError(f"sample_rate must be {LIVE_SAMPLE_RATES[0]} to {LIVE_SAMPLE_RATES[1]} Hz")
+    if sample_width not in LIVE_SAMPLE_WIDTHS:
+        raise ValueError(f"sample_width must be {' or '.join(map(str, LIVE_SAMPLE_WIDTHS))} bytes")
+    if channels not in LIVE_CHANNELS:
+        raise ValueError(f"channels must be {' or '.join(map(str, LIVE_CHANNELS))}")
+    return frame_rate, sample_width, channels
+
+def new_live_scorecard():
+    return LiveScorecard(KEYWORD_MATCHER, SCORECARD_CRITERIA, KEYWORDS, OUTBOUND_MARKERS, calculate_criterion_score,
+                         identifiers={'agent': (extract_agent_name, NAME_PATTERNS),
+                                      'account': (extract_account_number, ACCOUNT_PATTERNS)})
+
+def new_live_call(frame_rate=RECOGNIZER_SAMPLE_RATE, sample_width=RECOGNIZER_SAMPLE_WIDTH, channels=1):
+    return LiveCall(get_transcription_backend(), new_live_scorecard(), frame_rate, sample_width, channels)
+
+def finish_live_call(call):
+    # Remaining updates, then the full analysis of the call, which is stored
+    # like an uploaded one
+    updates = call.finish()
+    record_transcription(call.segments)
+    text = call.scorecard.text or UNKNOWN_AUDIO_TEXT
+    scorecard = call.scorecard.scorecard()
+    if KEYWORD_MATCHING == 'fuzzy':
+        # Live updates only match exactly; the final score matches like an upload
+        scorecard = score_transcript(text)
+    analysis_data, improvement_suggestions = analyze_call_with_scorecard(text, scorecard)
+    call_id = save_analysis(f"live-{uuid.uuid4().hex}", scorecard, text, filename='live call')
+    updates.append({
+        'type': 'final',
+        'call_id': call_id,
+        'original_text': text,
+        'segments': call.segments,
+        'analysis_data': analysis_data,
+        'improvement_suggestions': improvement_suggestions,
+    })
+    return updates
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/live')
+    def live_call(ws):
+        # Binary messages are raw PCM frames, 16 kHz mono 16-bit unless the
+        # query string sets sample_rate, sample_width or channels. The text
+        # message "end" finishes the call. Each transcribed chunk is answered
+        # with an update carrying the keywords first heard in it, the running
+        # scorecard and the criteria not yet mentioned. An unsupported format
+        # gets an error message and the socket is closed.
+        try:
+            audio_format = live_audio_format(request.args)
+        except ValueError as e:
+            ws.send(json.dumps({'type': 'error', 'error': str(e)}))
+            ws.close(reason=1008, message=str(e))
+            return
+        call = new_live_call(*audio_format)
+        while True:
+            message = ws.receive(timeout=LIVE_POLL_SECONDS)
+            if isinstance(message, (bytes, bytearray)):
+                call.add_audio(bytes(message))
+            elif message is not None and message.strip().lower() == 'end':
+                break
+            for update in call.updates():
+                ws.send(json.dumps(update))
+        for update in finish_live_call(call):
+            ws.send(json.dumps(update))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if job_queue is not None:
+        JOBS_PENDING.set(job_queue.pending)
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/play_audio/<filename>')
 def play_audio(filename):
+    # Only a job's own recording, named after the job by enqueue_upload
+    job = get_job_queue().get(filename.split('_', 1)[0])
+    if job is None or os.path.basename(job['filepath']) != filename or not allowed_file(filename):
+        abort(404)
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    return send_file(filepath)
+    if not os.path.isfile(filepath):
+        abort(404)
+    return send_file(os.path.abspath(filepath))
+
+# Imported by warm_up() only when the configured backends use them
+PRELOAD_MODULES = ['pydub', 'pydub.silence', 'speech_recognition', 'xlsxwriter']
+if TRANSLATION_BACKEND == 'google':
+    PRELOAD_MODULES.append('deep_translator')
+
+def warm_up():
+    # Does now what would otherwise happen on a worker's first call: imports
+    # the libraries calls use, loads langdetect's language profiles and
+    # compiles the page template. The keyword matchers are built at import.
+    # Called before forking, the workers share all of it, and freezing the
+    # garbage collector keeps it from writing to (and so copying) those pages.
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    language_detector()
+    app.jinja_env.get_template('index.html')
+    gc.freeze()
+
+def create_app(preload=False):
+    # Application factory for WSGI servers (see wsgi.py and gunicorn.conf.py).
+    # With preload the server imports the app once and forks its workers
+    # from that process, so the jobs interrupted by the last shutdown are freed
+    # here, once, and each worker only claims them; without it, every worker
+    # process would free and resume the same jobs.
+    global release_jobs
+    if preload:
+        warm_up()
+        release_interrupted(JOB_DB_PATH)
+        release_jobs = False
+    return app
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,110 @@
+
+import numpy as np
+
+from diarization import AGENT, CUSTOMER, FRAME_MS, runs, voiced_frames
+
+# A stretch with nobody speaking this long is dead air
+DEAD_AIR_SECONDS = 5
+# The agent starting to speak while the customer is speaking, and both still
+# talking this long after, is an interruption
+INTERRUPTION_MIN_MS = 300
+
+# What counts as good audio for the Voice & Data criterion. Cached analyses
+# don't notice changes here; bump app.PIPELINE_VERSION along with them.
+LOUDNESS_RANGE_DBFS = (-35, -6)
+MAX_CLIPPING_RATIO = 0.001
+MAX_DEAD_AIR_RATIO = 0.1
+SPEAKING_RATE_WPM = (110, 190)
+TALK_RATIO_RANGE = (0.3, 0.7)
+MAX_INTERRUPTIONS_PER_MINUTE = 1
+
+
+def measure(measured, agent_words=None, overlaps=False):
+    # Audio-quality metrics for a call. `measured` maps AGENT and CUSTOMER to
+    # the diarization.frame_levels result of their own audio (as diarize
+    # returns them), or has a single entry for an unseparated call, in which
+    # case talk ratio and interruptions are None. `overlaps` says whether the
+    # tracks can overlap in time (separate channels) so interruptions can be
+    # counted. `agent_words` gives the speaking rate.
+    speaker = AGENT if AGENT in measured else next(iter(measured))
+    levels, clipping, duration = measured[speaker]
+    voiced = {name: voiced_frames(result[0]) for name, result in measured.items()}
+    length = min(len(mask) for mask in voiced.values())
+    voiced = {name: mask[:length] for name, mask in voiced.items()}
+    anyone = np.logical_or.reduce(list(voiced.values())) if voiced else np.zeros(0, dtype=bool)
+    frame_seconds = FRAME_MS / 1000
+
+    starts, ends = runs(~anyone)
+    gaps = (ends - starts) * frame_seconds
+    dead_air = gaps[gaps >= DEAD_AIR_SECONDS]
+
+    agent_voiced = voiced[speaker]
+    speech_seconds = float(np.count_nonzero(agent_voiced)) * frame_seconds
+    agent_levels = levels[:length][agent_voiced]
+    loudness = float(10 * np.log10(np.mean(np.power(10, agent_levels / 10)))) if len(agent_levels) else None
+
+    talk_ratio = interruptions = None
+    if AGENT in voiced and CUSTOMER in voiced:
+        customer_seconds = float(np.count_nonzero(voiced[CUSTOMER])) * frame_seconds
+        if speech_seconds + customer_seconds:
+            talk_ratio = round(speech_seconds / (speech_seconds + customer_seconds), 3)
+        if overlaps:
+            interruptions = count_interruptions(voiced[AGENT], voiced[CUSTOMER])
+
+    return {
+        'duration_seconds': round(duration, 2),
+        'speech_seconds': round(speech_seconds, 2),
+        'talk_ratio': talk_ratio,
+        'speaking_rate_wpm': round(agent_words / (speech_seconds / 60), 1)
+        if agent_words and speech_seconds else None,
+        'dead_air_count': int(len(dead_air)),
+        'dead_air_seconds': round(float(dead_air.sum()), 2),
+        'longest_dead_air_seconds': round(float(dead_air.max()), 2) if len(dead_air) else 0.0,
+        'clipping_ratio': round(clipping, 5),
+        'loudness_dbfs': round(loudness, 1) if loudness is not None else None,
+        'interruptions': interruptions,
+    }
+
+
+def count_interruptions(agent, customer):
+    # Agent speech starting inside a customer turn and overlapping it for at
+    # least INTERRUPTION_MIN_MS
+    min_frames = max(INTERRUPTION_MIN_MS // FRAME_MS, 1)
+    overlap = agent & customer
+    count = 0
+    for start, end in zip(*runs(agent)):
+        if start and customer[start - 1] and np.count_nonzero(overlap[start:end]) >= min_frames:
+            count += 1
+    return count
+
+
+def issues(metrics):
+    # Problems found in the metrics, worded for the scorecard comments
+    found = []
+    loudness = metrics.get('loudness_dbfs')
+    if loudness is not None:
+        if loudness < LOUDNESS_RANGE_DBFS[0]:
+            found.append("speech too quiet")
+        elif loudness > LOUDNESS_RANGE_DBFS[1]:
+            found.append("speech too loud")
+    if metrics.get('clipping_ratio', 0) > MAX_CLIPPING_RATIO:
+        found.append("audio clipping")
+    duration = metrics.get('duration_seconds') or 0
+    if duration and metrics.get('dead_air_seconds', 0) / duration > MAX_DEAD_AIR_RATIO:
+        found.append(f"{metrics['dead_air_seconds']:.0f}s of dead air")
+    rate = metrics.get('speaking_rate_wpm')
+    if rate is not None:
+        if rate < SPEAKING_RATE_WPM[0]:
+            found.append(f"speaking slowly ({rate:.0f} wpm)")
+        elif rate > SPEAKING_RATE_WPM[1]:
+            found.append(f"speaking fast ({rate:.0f} wpm)")
+    talk_ratio = metrics.get('talk_ratio')
+    if talk_ratio is not None:
+        if talk_ratio > TALK_RATIO_RANGE[1]:
+            found.append(f"agent talking {talk_ratio:.0%} of the time")
+        elif talk_ratio < TALK_RATIO_RANGE[0]:
+            found.append(f"agent talking only {talk_ratio:.0%} of the time")
+    interruptions = metrics.get('interruptions')
+    if interruptions and duration and interruptions / (duration / 60) > MAX_INTERRUPTIONS_PER_MINUTE:
+        found.append(f"{interruptions} interruption{'s' if interruptions > 1 else ''}")
+    return found
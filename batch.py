@@ -0,0 +1,155 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import app
+from jobs import StageTimer
+
+RESULTS_FILE = 'results.jsonl'
+SUMMARY_FILE = 'results.csv'
+
+
+def find_recordings(path):
+    recordings = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if app.allowed_file(name):
+                recordings.append(os.path.abspath(os.path.join(root, name)))
+    return recordings
+
+
+def read_manifest(path):
+    # One recording per line; blank lines and '#' comments are ignored and
+    # relative paths are resolved against the manifest's directory
+    base = os.path.dirname(os.path.abspath(path))
+    recordings = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                recordings.append(os.path.join(base, line))
+    return recordings
+
+
+def load_done(results_path):
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partially written line from a crash
+            if record.get('status') == 'ok':
+                done.add(record['path'])
+    return done
+
+
+def analyze_recording(path, translate=False):
+    timer = StageTimer()
+    record = {'path': path}
+    try:
+        # Raises if any chunk failed to transcribe, leaving the recording
+        # unscored so a resumed run retries it
+        transcript = app.transcribe_call(path, timer)
+        original_text, agent_text = transcript['text'], transcript['agent_text']
+        if translate:
+            with timer.stage('process_text'):
+                record['data'] = app.process_text(agent_text)
+        with timer.stage('analyze'):
+            scorecard = app.score_transcript(agent_text, transcript['audio'])
+            analysis_data, improvement_suggestions = app.analyze_call_with_scorecard(agent_text, scorecard)
+        record.update(status='ok',
+                      call_key=app.call_key(path),
+                      scorecard=scorecard,
+                      original_text=original_text,
+                      agent_text=agent_text,
+                      diarization=transcript['diarization'],
+                      audio=transcript['audio'],
+                      analysis_data=analysis_data,
+                      improvement_suggestions=improvement_suggestions)
+    except Exception as e:
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    record['timings'] = timer.timings
+    return record
+
+
+def write_summary(results_path, summary_path):
+    # Consolidate the latest successful result for every recording into one CSV
+    latest = {}
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok':
+                latest[record['path']] = record
+
+    criteria = list(app.SCORECARD_CRITERIA) + ['OVERALL SCORE']
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['File'] + criteria)
+        for path in sorted(latest):
+            scores = {row[0]: row[2] if row[1] == 'Info' or row[0] == 'OVERALL SCORE' else row[1]
+                      for row in latest[path]['analysis_data']}
+            writer.writerow([path] + [scores.get(criterion, '') for criterion in criteria])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a directory or manifest of call recordings.")
+    parser.add_argument('source', help="Directory of recordings, or a manifest file listing one path per line")
+    parser.add_argument('-o', '--output', default='batch_results', help="Directory for the consolidated results")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--no-store', action='store_true', help="Don't save results to the analysis store")
+    parser.add_argument('--translate', action='store_true', help="Also run language detection and translation")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        recordings = find_recordings(args.source)
+    else:
+        recordings = read_manifest(args.source)
+
+    os.makedirs(args.output, exist_ok=True)
+    results_path = os.path.join(args.output, RESULTS_FILE)
+    done = load_done(results_path)
+    pending = [path for path in recordings if path not in done]
+    print(f"{len(recordings)} recordings, {len(recordings) - len(pending)} already scored, {len(pending)} to go")
+
+    start = time.perf_counter()
+    succeeded = failed = 0
+    if pending:
+        with open(results_path, 'a') as out, ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(analyze_recording, path, args.translate) for path in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                # Flush each record as it lands so a crash loses at most the calls in flight
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                if record['status'] == 'ok':
+                    if not args.no_store:
+                        # Saved from this process only, so SQLite sees a single writer
+                        app.save_analysis(record['call_key'], record['scorecard'], record['agent_text'],
+                                          os.path.basename(record['path']), record['audio'])
+                    succeeded += 1
+                else:
+                    failed += 1
+                    print(f"error: {record['path']}: {record['error']}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    if os.path.exists(results_path):
+        write_summary(results_path, os.path.join(args.output, SUMMARY_FILE))
+
+    rate = succeeded / elapsed * 60 if elapsed > 0 else 0
+    print(f"Scored {succeeded} calls ({failed} failed) in {elapsed:.1f}s - {rate:.1f} calls/minute")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
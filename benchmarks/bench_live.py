@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus  # noqa: E402  (benchmarks/ is on the path when run as a script)
+
+# The per-frame budget for live scoring
+FRAME_BUDGET_MS = 200
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time live call scoring per audio frame.")
+    parser.add_argument('-p', '--profile', default='long_en', choices=[profile[0] for profile in corpus.PROFILES],
+                        help="Corpus recording to stream")
+    parser.add_argument('--frame-ms', type=int, default=20, help="Audio per frame, in milliseconds")
+    parser.add_argument('--corpus', default=os.path.join('uploads', 'bench_corpus'),
+                        help="Corpus directory, generated on first use")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('TRANSCRIPTION_BACKEND', 'fake')
+    import app
+    paths = corpus.generate(os.path.abspath(args.corpus), [args.profile])[args.profile]
+    pcm = app.convert_to_wav(paths['audio']).getvalue()[44:]  # Skip the WAV header
+    frame_bytes = app.RECOGNIZER_SAMPLE_RATE * app.RECOGNIZER_SAMPLE_WIDTH * args.frame_ms // 1000
+
+    # Frames are sent as fast as they can be handled rather than in real time,
+    # so the timings are the server's own work per frame
+    call = app.new_live_call()
+    frame_times = []
+    updates = []
+    for i in range(0, len(pcm), frame_bytes):
+        start = time.perf_counter()
+        call.add_audio(pcm[i:i + frame_bytes])
+        updates.extend(call.updates())
+        frame_times.append(time.perf_counter() - start)
+    updates.extend(call.finish())
+
+    # What the incremental scorecard saves: scoring the whole transcript
+    # again after every chunk, as an upload would
+    text = call.scorecard.text
+    pieces = []
+    start = time.perf_counter()
+    for segment in call.segments:
+        pieces.append(segment['text'])
+        app.score_transcript(' '.join(pieces))
+    rescan_ms = (time.perf_counter() - start) * 1000
+    scorecard = app.new_live_call().scorecard
+    start = time.perf_counter()
+    for segment in call.segments:
+        scorecard.add_text(segment['text'])
+    incremental_ms = (time.perf_counter() - start) * 1000
+
+    frame_ms = [t * 1000 for t in frame_times]
+    print(json.dumps({
+        'profile': args.profile,
+        'frames': len(frame_ms),
+        'frame_ms': args.frame_ms,
+        'frame_p50_ms': round(percentile(frame_ms, 0.5), 3),
+        'frame_p95_ms': round(percentile(frame_ms, 0.95), 3),
+        'frame_max_ms': round(max(frame_ms), 3),
+        'frames_over_budget': sum(1 for t in frame_ms if t > FRAME_BUDGET_MS),
+        'updates': len(updates),
+        'update_latency_p50_ms': round(percentile([u['latency_ms'] for u in updates], 0.5), 1),
+        'transcript_chars': len(text),
+        'incremental_scoring_total_ms': round(incremental_ms, 3),
+        'rescan_scoring_total_ms': round(rescan_ms, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rss_mb():
+    # Peak resident set size of this process (ru_maxrss is KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time Excel report generation per call.")
+    parser.add_argument('-n', '--calls', type=int, default=200, help="Number of reports to write")
+    parser.add_argument('-s', '--sentences', type=int, default=150, help="Transcript sentences per call")
+    args = parser.parse_args(argv)
+
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - start
+    rss_imported = rss_mb()
+
+    sentence = "Could you please verify your details and confirm your residential address"
+    text = '. '.join([sentence] * args.sentences)
+    data = [(sentence, 'en', sentence)] * args.sentences
+    analysis_data, suggestions = app.analyze_call_with_scorecard(text)
+    metadata = {"filename": "bench.wav", "analysis_date": "2025-01-01 00:00:00",
+                "file_size": "1024.00 KB", "duration": "Unknown"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = []
+        for i in range(args.calls):
+            start = time.perf_counter()
+            app.save_to_excel(data, analysis_data, suggestions, text, metadata,
+                              excel_path=os.path.join(tmp, f"{i}.xlsx"))
+            timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    print(json.dumps({
+        'calls': args.calls,
+        'sentences': args.sentences,
+        'import_seconds': round(import_seconds, 3),
+        'report_ms_p50': round(timings[len(timings) // 2] * 1000, 2),
+        'report_ms_p95': round(timings[int(len(timings) * 0.95)] * 1000, 2),
+        'rss_start_mb': round(rss_start, 1),
+        'rss_after_import_mb': round(rss_imported, 1),
+        'rss_peak_mb': round(rss_mb(), 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
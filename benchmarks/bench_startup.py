@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import corpus  # noqa: E402  (benchmarks/ is on the path when run as a script)
+
+# What a fresh interpreter does before it can serve: import the app and
+# build the WSGI application, then handle a first call
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+application = app.create_app() if hasattr(app, 'create_app') else app.app
+imported = time.perf_counter()
+app.run_pipeline(sys.argv[1], 'cold.wav')
+print(json.dumps({'import_seconds': imported - start, 'first_call_seconds': time.perf_counter() - imported,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def smaps_rollup():
+    # Resident, proportional (shared pages split between the processes mapping
+    # them) and private memory of this process, in MB
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'rss_mb': fields['Rss'], 'pss_mb': fields['Pss'],
+            'private_mb': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def unique_audio(audio_bytes, index, workdir):
+    # A copy with its last sample changed, so the result cache can't answer
+    body = bytearray(audio_bytes)
+    body[-2:] = index.to_bytes(2, 'little')
+    path = os.path.join(workdir, f"call-{index}.wav")
+    with open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+
+def scratch_dir(workdir, name):
+    # Each process gets its own uploads folder, so no caches are shared
+    path = os.path.join(workdir, name)
+    os.makedirs(os.path.join(path, 'uploads'))
+    return path
+
+
+def worker(write_fd, preloaded, audio_path, workdir):
+    # Runs in a forked child, like a gunicorn worker: imports the app unless
+    # the parent already did, handles one call and reports its memory and how
+    # long the call took
+    try:
+        os.chdir(workdir)
+        import app
+        if not preloaded:
+            app.create_app() if hasattr(app, 'create_app') else app.app
+        start = time.perf_counter()
+        app.run_pipeline(audio_path, 'worker.wav')
+        result = dict(smaps_rollup(), first_call_seconds=time.perf_counter() - start)
+    except Exception as e:
+        result = {'error': f"{type(e).__name__}: {e}"}
+    os.write(write_fd, json.dumps(result).encode())
+    os._exit(0)
+
+
+def fork_workers(count, preloaded, audio_paths, workdir):
+    readers = []
+    for path in audio_paths[:count]:
+        cwd = scratch_dir(workdir, os.path.basename(path) + '.d')
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            worker(write_fd, preloaded, path, cwd)
+        os.close(write_fd)
+        readers.append((pid, read_fd))
+    results = []
+    for pid, read_fd in readers:
+        chunks = []
+        while chunk := os.read(read_fd, 65536):
+            chunks.append(chunk)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        results.append(json.loads(b''.join(chunks)))
+    errors = [result['error'] for result in results if 'error' in result]
+    if errors:
+        raise RuntimeError(errors[0])
+    return {key: round(statistics.mean(result[key] for result in results), 3 if key.endswith('seconds') else 1)
+            for key in results[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time and per-worker memory.")
+    parser.add_argument('-n', '--runs', type=int, default=5, help="Cold starts to time")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="Worker processes to fork")
+    parser.add_argument('--corpus', default=os.path.join('uploads', 'bench_corpus'),
+                        help="Corpus directory, generated on first use")
+    args = parser.parse_args(argv)
+
+    audio = corpus.generate(os.path.abspath(args.corpus), ['short_en'])['short_en']['audio']
+    with open(audio, 'rb') as f:
+        audio_bytes = f.read()
+    workdir = tempfile.mkdtemp(prefix='callanalysis-bench-')
+    # Offline backends and a scratch working directory, as in run.py
+    os.environ['TRANSCRIPTION_BACKEND'] = 'fake'
+    os.environ['TRANSLATION_BACKEND'] = 'fake'
+    os.environ.pop('ANALYSIS_DB_PATH', None)
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))
+    os.chdir(scratch_dir(workdir, 'parent'))
+    try:
+        paths = [unique_audio(audio_bytes, i, workdir) for i in range(args.runs + 2 * args.workers)]
+        cold = []
+        for path in paths[:args.runs]:
+            output = subprocess.run([sys.executable, '-c', COLD_START, path], check=True, capture_output=True,
+                                    text=True, cwd=scratch_dir(workdir, os.path.basename(path) + '.d')).stdout
+            cold.append(json.loads(output.strip().splitlines()[-1]))
+        paths = paths[args.runs:]
+
+        # Without preloading, each worker imports the app after the fork and
+        # holds its own copy; with it, the workers share the parent's pages
+        # until they write to them
+        separate = fork_workers(args.workers, False, paths[:args.workers], workdir)
+        start = time.perf_counter()
+        import app
+        if hasattr(app, 'create_app'):
+            app.create_app(preload=True)
+        preload_seconds = time.perf_counter() - start
+        preloaded = fork_workers(args.workers, True, paths[args.workers:], workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({
+        'cold_start': {
+            'runs': args.runs,
+            'import_seconds_p50': round(statistics.median(run['import_seconds'] for run in cold), 3),
+            'first_call_seconds_p50': round(statistics.median(run['first_call_seconds'] for run in cold), 3),
+            'total_seconds_p50': round(statistics.median(run['import_seconds'] + run['first_call_seconds']
+                                                         for run in cold), 3),
+            'modules_imported': cold[0]['modules'],
+        },
+        'workers': args.workers,
+        'per_worker': {'without_preload': separate, 'with_preload': preloaded},
+        'preload_seconds': round(preload_seconds, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
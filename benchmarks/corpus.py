@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import sys
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (name, seconds of audio, transcript sentences, share of non-English sentences,
+#  share of sentences carrying a scorecard keyword)
+PROFILES = [
+    ('short_en', 30, 20, 0.0, 0.2),
+    ('long_en', 300, 400, 0.0, 0.2),
+    ('short_mixed', 30, 20, 0.5, 0.2),
+    ('long_mixed', 300, 400, 0.3, 0.2),
+    ('keyword_heavy', 120, 80, 0.0, 0.9),
+]
+
+# Uploads arrive as phone or desktop recordings, not in the recognizer's format
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNELS = 2
+
+OPENINGS = ["Good morning, my name is {name} calling from the collections department",
+            "Hello, this is {name} speaking on behalf of the bank",
+            "Good afternoon, I am {name} and I am following up on your account {account}"]
+AGENTS = ["Thabo", "Lerato", "Sipho", "Naledi", "Johan", "Anele"]
+FILLER = ["the customer said the payment would be made at the end of the month",
+          "we spoke about the balance on the account and the options available",
+          "the client asked for a call back later in the week after work",
+          "there was some background noise on the line during the call",
+          "the customer wanted to know why the amount had changed since last month",
+          "I explained the statement and went through the recent transactions",
+          "the client said they had already spoken to someone at the branch",
+          "we agreed to look at the account again once the salary is paid"]
+FOREIGN = ["die kliënt het gesê dat die betaling volgende week gemaak sal word",
+           "ek verstaan dat dit moeilik is maar ons moet 'n reëling tref",
+           "el cliente dijo que pagará la cuenta a finales de mes",
+           "necesitamos confirmar su dirección y su número de teléfono",
+           "le client a promis de payer le montant avant vendredi",
+           "nous devons vérifier vos coordonnées avant de continuer"]
+
+
+def make_transcript(rng, sentences, mixed=0.0, density=0.2):
+    # A call transcript of `sentences` sentences: an opening that names the
+    # agent and account, then filler, foreign-language sentences and
+    # sentences built around scorecard keywords in the given proportions
+    import app
+    keywords = [keyword for criterion_keywords in app.KEYWORDS.values() for keyword in criterion_keywords]
+    lines = [rng.choice(OPENINGS).format(name=rng.choice(AGENTS), account=rng.randrange(10000, 99999))]
+    for _ in range(sentences - 1):
+        roll = rng.random()
+        if roll < density:
+            lines.append(f"{rng.choice(FILLER)} and {rng.choice(keywords)} was discussed")
+        elif roll < density + mixed * (1 - density):
+            lines.append(rng.choice(FOREIGN))
+        else:
+            # A random number keeps sentences distinct so translation caches don't flatter the timings
+            lines.append(f"{rng.choice(FILLER)} on day {rng.randrange(1, 10000)}")
+    return '. '.join(lines) + '.'
+
+
+def make_audio(path, seconds, rng, sample_rate=AUDIO_SAMPLE_RATE, channels=AUDIO_CHANNELS):
+    # Speech-like 16-bit WAV: bursts of band-limited noise separated by
+    # pauses, so silence detection has real cut points to find
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    total = int(seconds * sample_rate)
+    samples = np.zeros(total, dtype=np.float32)
+    position = 0
+    while position < total:
+        burst = int(np_rng.uniform(1.0, 6.0) * sample_rate)
+        end = min(position + burst, total)
+        noise = np_rng.standard_normal(end - position).astype(np.float32)
+        envelope = 0.5 + 0.5 * np.sin(np.linspace(0, np.pi * np_rng.uniform(4, 20), end - position))
+        samples[position:end] = np.convolve(noise, np.ones(8) / 8, mode='same') * envelope * 6000
+        position = end + int(np_rng.uniform(0.3, 1.5) * sample_rate)
+    frames = np.repeat(samples.clip(-32768, 32767).astype('<i2')[:, None], channels, axis=1)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(frames.tobytes())
+    return path
+
+
+def generate(output, profiles=None, seed=0):
+    # Writes <output>/<profile>.txt and <output>/<profile>.wav for each
+    # profile; existing files are kept, as the corpus is deterministic
+    os.makedirs(output, exist_ok=True)
+    corpus = {}
+    for name, seconds, sentences, mixed, density in PROFILES:
+        if profiles and name not in profiles:
+            continue
+        text_path = os.path.join(output, f"{name}.txt")
+        audio_path = os.path.join(output, f"{name}.wav")
+        if not os.path.exists(text_path):
+            with open(text_path, 'w') as f:
+                f.write(make_transcript(random.Random(f"{seed}-{name}-text"), sentences, mixed, density))
+        if not os.path.exists(audio_path):
+            make_audio(audio_path, seconds, random.Random(f"{seed}-{name}-audio"))
+        corpus[name] = {'text': text_path, 'audio': audio_path}
+    return corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the synthetic call corpus used by the benchmarks.")
+    parser.add_argument('-o', '--output', default=os.path.join('uploads', 'bench_corpus'), help="Corpus directory")
+    parser.add_argument('-p', '--profile', action='append', choices=[profile[0] for profile in PROFILES],
+                        help="Only generate this profile (repeatable)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for name, paths in generate(args.output, args.profile, args.seed).items():
+        print(f"{name}: {paths['text']}, {paths['audio']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corpus  # noqa: E402  (benchmarks/ is on the path when run as a script)
+from diarization import frame_levels  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+STAGES = ['convert_to_wav', 'transcribe_audio', 'audio_metrics', 'process_text', 'analyze_call_with_scorecard',
+          'fuzzy_match', 'generate_improvement_suggestions', 'save_to_excel', 'upload_file']
+# Stages whose p50 moves less than this between runs are never reported as
+# regressions, since sub-millisecond timings are mostly noise
+MIN_REGRESSION_MS = 2.0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(fn, iterations, setup=None):
+    # Times `iterations` calls of fn(setup()), after one untimed call so that
+    # first-use costs (lazy imports, warming caches) aren't in the samples,
+    # then makes one more call under tracemalloc for the peak Python heap,
+    # which tracing would skew if timed
+    fn(setup() if setup else None)
+    timings = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    fn(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'per_second': round(len(timings) / sum(timings), 2),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+    }
+
+
+def bench_profile(app, client, name, paths, iterations, workdir):
+    with open(paths['text']) as f:
+        text = f.read()
+    with open(paths['audio'], 'rb') as f:
+        audio_bytes = f.read()
+    wav = app.convert_to_wav(paths['audio'])
+    wav_bytes = wav.getvalue() if isinstance(wav, io.BytesIO) else open(wav, 'rb').read()
+    data = app.process_text(text)
+    analysis_data, suggestions = app.analyze_call_with_scorecard(text)
+    exact_matches = app.KEYWORD_MATCHER.find(text)
+    counter = iter(range(10 ** 9))
+
+    def fresh_translator():
+        # A new, empty translation cache each time so every run is a cold one
+        app.translator = None
+        app.TRANSLATION_CACHE_PATH = os.path.join(workdir, f"translations-{next(counter)}.db")
+
+    def unique_upload():
+        # Change the last sample so the result cache can't answer from a previous run
+        body = bytearray(audio_bytes)
+        body[-2:] = (next(counter) % 65536).to_bytes(2, 'little')
+        return bytes(body)
+
+    def upload(body):
+        response = client.post('/', data={'file': (io.BytesIO(body), f"{name}.wav")},
+                               content_type='multipart/form-data')
+        job_id = response.headers['Location'].rstrip('/').rsplit('/', 1)[-1]
+        while app.get_job_queue().status(job_id)['status'] not in (app.DONE, app.FAILED):
+            time.sleep(0.005)
+        status = app.get_job_queue().status(job_id)['status']
+        if status != app.DONE:
+            raise RuntimeError(f"Benchmark upload {job_id} failed")
+        client.get(response.headers['Location'])
+
+    stages = {
+        'convert_to_wav': (lambda _: app.convert_to_wav(paths['audio']), None),
+        'transcribe_audio': (lambda _: app.transcribe_audio(io.BytesIO(wav_bytes)), None),
+        'audio_metrics': (lambda _: app.audio_metrics.measure({app.AGENT: frame_levels(io.BytesIO(wav_bytes))},
+                                                              len(text.split())), None),
+        'process_text': (lambda _: app.process_text(text), fresh_translator),
+        'analyze_call_with_scorecard': (lambda _: app.analyze_call_with_scorecard(text), None),
+        # What KEYWORD_MATCHING=fuzzy adds to scoring
+        'fuzzy_match': (lambda _: app.FUZZY_MATCHER.find(text, skip=exact_matches), None),
+        'generate_improvement_suggestions': (lambda _: app.generate_improvement_suggestions(analysis_data), None),
+        'save_to_excel': (lambda _: app.save_to_excel(data, analysis_data, suggestions, text,
+                                                      excel_path=os.path.join(workdir, f"{name}.xlsx")), None),
+        'upload_file': (upload, unique_upload),
+    }
+    results = {}
+    for stage in STAGES:
+        fn, setup = stages[stage]
+        results[stage] = measure(fn, iterations, setup)
+        print(f"{name:>14} {stage:<33} p50 {results[stage]['p50_ms']:>9.2f} ms  "
+              f"p95 {results[stage]['p95_ms']:>9.2f} ms  peak {results[stage]['peak_mb']:>7.2f} MB",
+              file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Stages whose p50 is more than `threshold` (a fraction) slower than the baseline
+    regressions = []
+    for name, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get('results', {}).get(name, {}).get(stage)
+            if not previous:
+                continue
+            limit = previous['p50_ms'] * (1 + threshold)
+            if current['p50_ms'] > limit and current['p50_ms'] - previous['p50_ms'] > MIN_REGRESSION_MS:
+                regressions.append(f"{name}/{stage}: p50 {current['p50_ms']} ms vs baseline "
+                                   f"{previous['p50_ms']} ms (limit {limit:.2f} ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage and the upload flow "
+                                                 "on a synthetic call corpus.")
+    parser.add_argument('-n', '--iterations', type=int, default=5, help="Timed runs per stage")
+    parser.add_argument('-p', '--profile', action='append', choices=[profile[0] for profile in corpus.PROFILES],
+                        help="Only run this corpus profile (repeatable)")
+    parser.add_argument('--corpus', default=os.path.join('uploads', 'bench_corpus'),
+                        help="Corpus directory, generated on first use")
+    parser.add_argument('-o', '--output', help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results to compare against")
+    parser.add_argument('--check', action='store_true',
+                        help="Exit with status 1 if any stage regressed past the threshold")
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="Allowed p50 slowdown against the baseline, as a fraction")
+    parser.add_argument('--save-baseline', action='store_true', help="Overwrite the baseline with these results")
+    args = parser.parse_args(argv)
+
+    corpus_dir = os.path.abspath(args.corpus)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline)
+    workdir = tempfile.mkdtemp(prefix='callanalysis-bench-')
+
+    # Offline backends and a scratch working directory, set before the app is
+    # imported so its uploads, caches and databases all start out empty
+    os.environ['TRANSCRIPTION_BACKEND'] = 'fake'
+    os.environ['TRANSLATION_BACKEND'] = 'fake'
+    os.environ.pop('ANALYSIS_DB_PATH', None)
+    os.chdir(workdir)
+    start = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - start
+    client = app.app.test_client()
+
+    paths = corpus.generate(corpus_dir, args.profile)
+    try:
+        results = {name: bench_profile(app, client, name, paths[name], args.iterations, workdir) for name in paths}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'iterations': args.iterations,
+            'import_seconds': round(import_seconds, 3),
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    status = 0
+    if os.path.exists(baseline) and not args.save_baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions and args.check:
+            status = 1
+    if args.save_baseline:
+        with open(baseline, 'w') as f:
+            f.write(text + '\n')
+        print(f"Baseline written to {baseline}", file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import tempfile
+import wave
+from contextlib import contextmanager
+
+import numpy as np
+
+AGENT = 'agent'
+CUSTOMER = 'customer'
+MODES = ('auto', 'stereo', 'off')
+MONO_AGENTS = ('louder', 'first')
+
+# Turn detection for single-channel recordings: speech is any analysis frame
+# this far above the noise floor, a pause of TURN_MIN_SILENCE_MS ends a turn,
+# and voiced bursts shorter than TURN_MIN_MS (clicks, breaths) are dropped
+FRAME_MS = 30
+VOICE_ABOVE_FLOOR_DB = 10
+TURN_MIN_SILENCE_MS = 400
+TURN_MIN_MS = 300
+# Turns are split into two speakers by loudness; if the two levels are closer
+# than this the speakers can't be told apart and the call isn't split
+MIN_LEVEL_GAP_DB = 6
+# Two channels this similar are the same mix recorded twice; compared on
+# every SAME_CHANNEL_STEP-th sample, which is plenty to tell two mixes apart
+SAME_CHANNEL_RATIO = 0.05
+SAME_CHANNEL_STEP = 16
+# Audio is read and the speaker tracks written this many seconds at a time,
+# so memory doesn't grow with the length of the call
+BLOCK_SECONDS = 30
+CLIP_LEVEL = 32440  # 99% of full scale
+
+
+@contextmanager
+def open_wav(source):
+    # 16-bit WAV (path or file object), rewound before and after reading
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    try:
+        with wave.open(source, 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Diarization expects 16-bit audio")
+            yield wav
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+
+def iter_blocks(wav, block_seconds=BLOCK_SECONDS):
+    # Yields the audio as int16 arrays of shape (frames, channels), each a
+    # whole number of analysis frames except perhaps the last
+    frame = wav.getframerate() * FRAME_MS // 1000
+    block_frames = max(int(block_seconds * wav.getframerate()) // frame, 1) * frame
+    while True:
+        data = wav.readframes(block_frames)
+        if not data:
+            return
+        yield np.frombuffer(data, dtype='<i2').reshape(-1, wav.getnchannels())
+
+
+def mix(block):
+    # Both channels of a dual-channel block averaged into one
+    if block.shape[1] == 1:
+        return block[:, 0]
+    return ((block[:, 0].astype(np.int32) + block[:, 1]) >> 1).astype('<i2')
+
+
+class LevelMeter:
+    # Measures audio pushed in block by block, each a whole number of
+    # analysis frames: the level in dBFS of each frame (channels averaged),
+    # the share of samples clipped and the duration. A partial frame at the
+    # end is ignored. Only one level per frame is kept.
+    def __init__(self, frame_rate, channels):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.frame = frame_rate * FRAME_MS // 1000
+        self._levels = []
+        self._clipped = self._samples = 0
+
+    def add(self, block):
+        # int16 array of shape (frames, channels)
+        channels = self.channels
+        count = len(block) // self.frame
+        if not count:
+            return
+        block = block[:count * self.frame].reshape(count, self.frame * channels)
+        # Sample counts only for the frames that reach the clip level
+        peaks = np.maximum(block.max(axis=1), -block.min(axis=1).astype(np.int32))
+        loud = peaks >= CLIP_LEVEL
+        if loud.any():
+            self._clipped += int(np.count_nonzero(np.abs(block[loud].astype(np.int32)) >= CLIP_LEVEL))
+        self._samples += block.size
+        mixed = block[:, 0::channels].astype(np.float32)
+        for channel in range(1, channels):
+            mixed += block[:, channel::channels]
+        if channels > 1:
+            mixed /= channels
+        power = np.einsum('ij,ij->i', mixed, mixed) / self.frame
+        self._levels.append(10 * np.log10(power + 1.0) - 20 * np.log10(32768))
+
+    def result(self):
+        # (level in dBFS per frame, share of samples clipped, duration in seconds)
+        levels = np.concatenate(self._levels) if self._levels else np.zeros(0)
+        clipping = self._clipped / self._samples if self._samples else 0.0
+        return levels, clipping, self._samples / self.channels / self.frame_rate
+
+
+def frame_levels(source, block_seconds=BLOCK_SECONDS):
+    # LevelMeter's result for a whole 16-bit WAV (path or file object)
+    with open_wav(source) as wav:
+        meter = LevelMeter(wav.getframerate(), wav.getnchannels())
+        for block in iter_blocks(wav, block_seconds):
+            meter.add(block)
+    return meter.result()
+
+
+def voiced_frames(levels):
+    # Frames with speech: those this far above the recording's noise floor
+    if not len(levels):
+        return np.zeros(0, dtype=bool)
+    return levels > np.percentile(levels, 10) + VOICE_ABOVE_FLOOR_DB
+
+
+def runs(mask):
+    # (start, end) frame indexes of each run of True
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+
+def scan(source, block_seconds=BLOCK_SECONDS):
+    # One pass over the recording. Returns (channels, frame rate, LevelMeter
+    # result of the whole call, whether the two channels of a dual-channel
+    # recording carry the same mix).
+    with open_wav(source) as wav:
+        channels = wav.getnchannels()
+        frame_rate = wav.getframerate()
+        meter = LevelMeter(frame_rate, channels)
+        # Sums of squares over every SAME_CHANNEL_STEP-th sample of the left
+        # and right channels and of their difference
+        squares = np.zeros(3)
+        compared = position = 0
+        for block in iter_blocks(wav, block_seconds):
+            if channels == 2:
+                pair = block[-position % SAME_CHANNEL_STEP::SAME_CHANNEL_STEP].astype(np.float64)
+                squares += np.square(pair).sum(axis=0).tolist() + [np.square(pair[:, 0] - pair[:, 1]).sum()]
+                compared += len(pair)
+            position += len(block)
+            meter.add(block)
+    same = None
+    if channels == 2:
+        left, right, difference = np.sqrt(squares / compared) if compared else np.zeros(3)
+        same = bool(difference <= SAME_CHANNEL_RATIO * max(left, right, 1.0))
+    return channels, frame_rate, meter.result(), same
+
+
+def find_turns(db, frame):
+    # [(start sample, end sample, level in dBFS)] for each stretch of speech,
+    # from the level of each analysis frame of `frame` samples
+    voiced = voiced_frames(db)
+    merged = []
+    for start, end in zip(*(edges.tolist() for edges in runs(voiced))):
+        if merged and (start - merged[-1][1]) * FRAME_MS < TURN_MIN_SILENCE_MS:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    turns = []
+    for start, end in merged:
+        if (end - start) * FRAME_MS >= TURN_MIN_MS:
+            level = float(np.median(db[start:end][voiced[start:end]]))
+            turns.append((start * frame, end * frame, level))
+    return turns
+
+
+def louder_turns(levels):
+    # Two-means clustering of the turn levels; returns a boolean array marking
+    # the louder speaker's turns, or None if there aren't two distinct levels
+    low, high = levels.min(), levels.max()
+    louder = None
+    for _ in range(20):
+        louder = np.abs(levels - high) < np.abs(levels - low)
+        if louder.all() or not louder.any():
+            return None
+        low, high = levels[~louder].mean(), levels[louder].mean()
+    if high - low < MIN_LEVEL_GAP_DB:
+        return None
+    return np.abs(levels - high) < np.abs(levels - low)
+
+
+def split_turns(levels, frame_rate, mono_agent='louder'):
+    # Single-channel recording: assigns each turn found in the frame levels to
+    # a speaker. Returns [(start sample, end sample, is agent)], or None if the
+    # speakers can't be told apart. The agent is the louder speaker (close to
+    # the headset microphone) or, with mono_agent='first', whoever speaks first.
+    turns = find_turns(levels, frame_rate * FRAME_MS // 1000)
+    if len(turns) < 2:
+        return None
+    louder = louder_turns(np.array([level for _, _, level in turns]))
+    if louder is None:
+        return None
+    agent_turns = louder if mono_agent == 'louder' else louder == louder[0]
+    return [(start, end, bool(is_agent)) for (start, end, _), is_agent in zip(turns, agent_turns)]
+
+
+def write_tracks(source, frame_rate, speakers, block_seconds=BLOCK_SECONDS):
+    # Writes a full-length mono WAV per speaker to a temporary file, block by
+    # block, measuring each as it goes; speakers(block, start sample) returns
+    # the agent's and the customer's samples of a block. Returns
+    # ({AGENT: file, CUSTOMER: file}, {AGENT: levels, CUSTOMER: levels}) with
+    # each file rewound and deleted when closed, and LevelMeter's results.
+    tracks = {AGENT: tempfile.TemporaryFile(prefix='diarize-'), CUSTOMER: tempfile.TemporaryFile(prefix='diarize-')}
+    meters = {speaker: LevelMeter(frame_rate, 1) for speaker in tracks}
+    writers = {}
+    for speaker, track in tracks.items():
+        writers[speaker] = wave.open(track, 'wb')
+        writers[speaker].setnchannels(1)
+        writers[speaker].setsampwidth(2)
+        writers[speaker].setframerate(frame_rate)
+    position = 0
+    with open_wav(source) as wav:
+        for block in iter_blocks(wav, block_seconds):
+            for speaker, samples in zip((AGENT, CUSTOMER), speakers(block, position)):
+                samples = np.ascontiguousarray(samples, dtype='<i2')
+                writers[speaker].writeframes(samples.tobytes())
+                meters[speaker].add(samples[:, None])
+            position += len(block)
+    for speaker, track in tracks.items():
+        writers[speaker].close()
+        track.seek(0)
+    return tracks, {speaker: meter.result() for speaker, meter in meters.items()}
+
+
+def turn_speakers(turns):
+    # speakers() for write_tracks from split_turns: each speaker's track has
+    # the other speaker's turns (and the pauses) silenced, so timestamps
+    # still line up
+    def speakers(block, position):
+        mono = mix(block)
+        agent = np.zeros(len(mono), dtype=bool)
+        customer = np.zeros(len(mono), dtype=bool)
+        for start, end, is_agent in turns:
+            if start < position + len(mono) and end > position:
+                (agent if is_agent else customer)[max(start - position, 0):end - position] = True
+        return np.where(agent, mono, 0), np.where(customer, mono, 0)
+    return speakers
+
+
+def diarize(source, mode='auto', agent_channel=0, mono_agent='louder'):
+    # Returns (method, tracks, levels). When the call is split, tracks maps
+    # AGENT and CUSTOMER to a mono WAV temporary file each, for the caller to
+    # close, and levels maps them to each track's LevelMeter result; when it
+    # isn't, method and tracks are None and levels has the whole call's under
+    # AGENT. The recording is read in blocks, twice when it is split.
+    # Dual-channel recordings are split by channel ('stereo'); in 'auto' mode
+    # single-channel ones are split by turn loudness ('energy').
+    if mode not in MODES:
+        raise ValueError(f"Unknown diarization mode {mode!r}, expected one of {', '.join(MODES)}")
+    channels, frame_rate, levels, same = scan(source)
+    if mode != 'off' and channels == 2 and not same:
+        return ('stereo',) + write_tracks(
+            source, frame_rate, lambda block, position: (block[:, agent_channel], block[:, 1 - agent_channel]))
+    if mode == 'auto':
+        turns = split_turns(levels[0], frame_rate, mono_agent)
+        if turns:
+            return ('energy',) + write_tracks(source, frame_rate, turn_speakers(turns))
+    return None, None, {AGENT: levels}
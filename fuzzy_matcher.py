@@ -0,0 +1,214 @@
+import hashlib
+import json
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+TOKEN = re.compile(r"[a-z0-9']+")
+# Too common to anchor a match on; they still count when aligning a phrase
+STOPWORDS = frozenset(
+    "a an and are at be by can do for from have i if in is it me my of on or our so that the their this "
+    "to we will with you your".split())
+# Inflectional and common derivational endings, tried in order, with what
+# replaces them (payments -> pay, verified -> verify, security -> secur)
+SUFFIXES = (('ations', 'ate'), ('ation', 'ate'), ('ities', ''), ('ity', ''), ('ments', ''), ('ment', ''),
+            ('ings', ''), ('ing', ''), ('ies', 'y'), ('ied', 'y'), ('ed', ''), ('ly', ''), ('s', ''))
+
+# A transcript token matches a phrase token if their lemmas are this many
+# character edits apart or fewer, by lemma length (short words must be exact)
+MAX_TOKEN_EDITS = ((4, 0), (8, 1), (None, 2))
+# Similarity of two different words with the same lemma ("secure" and "security")
+LEMMA_SIMILARITY = 0.95
+# Alignment costs, in phrase tokens: a phrase word missing from the
+# transcript, and an extra transcript word inside the phrase
+MISSING_COST = {True: 0.5, False: 1.0}  # keyed by is-stopword
+EXTRA_COST = {True: 0.25, False: 0.5}
+MIN_CONFIDENCE = 0.85
+# How many extra transcript tokens either side of a candidate are aligned
+WINDOW_SLACK = 2
+TOKEN_CACHE_SIZE = 50000
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def lemma(token):
+    # A cheap suffix-stripping lemmatizer. It only has to map the forms a
+    # phrase is likely to be said in to the same string, not to real words.
+    token = token.replace("'", '')
+    for suffix, replacement in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == 's' and token.endswith(('ss', 'us', 'is')):
+                continue
+            token = token[:-len(suffix)] + replacement
+            break
+    if len(token) > 4 and token.endswith('e'):
+        token = token[:-1]
+    if len(token) > 3 and token[-1] == token[-2] and token[-1] not in 'lsz':
+        token = token[:-1]
+    return token
+
+
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, or limit + 1 once it is certain to exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edits(word):
+    for length, edits in MAX_TOKEN_EDITS:
+        if length is None or len(word) <= length:
+            return edits
+
+
+class FuzzyMatcher:
+    # Finds phrases said in slightly different words: other word forms (by
+    # lemma), misrecognized words (by character edit distance) and extra or
+    # missing words (by aligning the phrase token by token). The phrase
+    # vocabulary is indexed by character trigram once, and each transcript
+    # word's similar phrase words are remembered, so a call costs one pass
+    # over its words plus an alignment per promising spot.
+    def __init__(self, phrases, min_confidence=MIN_CONFIDENCE):
+        self.phrases = list(dict.fromkeys(phrase.lower() for phrase in phrases))
+        self.min_confidence = min_confidence
+        self._spellings = [TOKEN.findall(phrase) for phrase in self.phrases]
+        self._tokens = [list(map(lemma, spellings)) for spellings in self._spellings]
+        self._index = {phrase: index for index, phrase in enumerate(self.phrases)}
+        self._content = [sum(1 for token in tokens if token not in STOPWORDS) for tokens in self._tokens]
+        # Content word lemma -> [(phrase index, position in phrase)]. Phrases
+        # made only of stopwords ("this is") are left to exact matching.
+        self._postings = defaultdict(list)
+        for index, tokens in enumerate(self._tokens):
+            for position, token in enumerate(tokens):
+                if token not in STOPWORDS:
+                    self._postings[token].append((index, position))
+        self._trigrams = defaultdict(set)
+        for word in self._postings:
+            for gram in trigrams(word):
+                self._trigrams[gram].add(word)
+        self._similar = {}
+        self._word_hits = {}
+
+    @property
+    def fingerprint(self):
+        # Hash of the settings, besides the phrases, that decide what find() matches
+        settings = [self.min_confidence, MAX_TOKEN_EDITS, LEMMA_SIMILARITY, MISSING_COST, EXTRA_COST,
+                    WINDOW_SLACK, SUFFIXES, sorted(STOPWORDS)]
+        return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+    def similar(self, word):
+        # [(phrase word, similarity)] for the phrase words `word` can stand for
+        found = self._similar.get(word)
+        if found is not None:
+            return found
+        found = []
+        if word in self._postings:
+            found.append((word, 1.0))
+        limit = max_edits(word)
+        if limit:
+            candidates = set()
+            for gram in trigrams(word):
+                candidates.update(self._trigrams.get(gram, ()))
+            for candidate in candidates:
+                if candidate != word and min(max_edits(candidate), limit):
+                    distance = edit_distance(word, candidate, min(max_edits(candidate), limit))
+                    if distance <= min(max_edits(candidate), limit):
+                        found.append((candidate, 1 - distance / max(len(word), len(candidate))))
+        if len(self._similar) >= TOKEN_CACHE_SIZE:
+            self._similar.clear()
+        self._similar[word] = found
+        return found
+
+    def _token_similarity(self, phrase_token, spelling, word, said):
+        if phrase_token == word:
+            return 1.0 if spelling == said else LEMMA_SIMILARITY
+        if phrase_token in STOPWORDS or word in STOPWORDS:
+            return 0.0
+        for candidate, similarity in self.similar(word):
+            if candidate == phrase_token:
+                return similarity
+        return 0.0
+
+    def _align(self, index, window, said):
+        # Best alignment of the whole phrase against any stretch of the window
+        # (lemmas, and the words as said). Returns (cost, first, last) with
+        # first/last indexes into window.
+        phrase_tokens, spellings = self._tokens[index], self._spellings[index]
+        k, w = len(phrase_tokens), len(window)
+        inf = float('inf')
+        cost = [[0.0] * (w + 1)] + [[inf] * (w + 1) for _ in range(k)]
+        start = [list(range(w + 1))] + [[0] * (w + 1) for _ in range(k)]
+        for i, (token, spelling) in enumerate(zip(phrase_tokens, spellings), 1):
+            missing = MISSING_COST[token in STOPWORDS]
+            cost[i][0] = cost[i - 1][0] + missing
+            for j, word in enumerate(window, 1):
+                similarity = self._token_similarity(token, spelling, word, said[j - 1])
+                options = [(cost[i - 1][j] + missing, start[i - 1][j]),
+                           (cost[i][j - 1] + EXTRA_COST[word in STOPWORDS], start[i][j - 1])]
+                if similarity:
+                    options.append((cost[i - 1][j - 1] + 1 - similarity, start[i - 1][j - 1]))
+                cost[i][j], start[i][j] = min(options)
+        best = min(range(1, w + 1), key=lambda j: cost[k][j])
+        return cost[k][best], start[k][best], best - 1
+
+    def _hits(self, word):
+        # [(phrase index, position in phrase)] the word could fill, remembered
+        hits = self._word_hits.get(word)
+        if hits is None:
+            hits = [] if word in STOPWORDS else \
+                [hit for candidate, _ in self.similar(word) for hit in self._postings[candidate]]
+            if len(self._word_hits) >= TOKEN_CACHE_SIZE:
+                self._word_hits.clear()
+            self._word_hits[word] = hits
+        return hits
+
+    def find(self, text, skip=()):
+        # Maps each phrase found to its best match: (the words matched, as
+        # said, and a confidence from 0 to 1). Phrases in `skip`, e.g. those
+        # already found exactly, aren't looked for.
+        skip = {self._index[phrase.lower()] for phrase in skip if phrase.lower() in self._index}
+        said = TOKEN.findall(text.lower())
+        words = list(map(lemma, said))
+        # Phrase positions each candidate start has a matching word for
+        candidates = defaultdict(set)
+        word_hits = self._word_hits
+        for i, word in enumerate(words):
+            hits = word_hits.get(word)
+            if hits is None:
+                hits = self._hits(word)
+            for index, position in hits:
+                if index not in skip:
+                    candidates[index, i - position].add(position)
+
+        best = {}
+        done = set()
+        for index, start in sorted(candidates):
+            if (index, start) in done or best.get(index, (0,))[-1] == 1.0:
+                continue
+            phrase_tokens = self._tokens[index]
+            nearby = set()
+            for offset in range(-WINDOW_SLACK, WINDOW_SLACK + 1):
+                nearby |= candidates.get((index, start + offset), set())
+                done.add((index, start + offset))
+            # Each missing content word costs at least a whole token
+            if self._content[index] - len(nearby) > (1 - self.min_confidence) * len(phrase_tokens):
+                continue
+            lo = max(start - WINDOW_SLACK, 0)
+            hi = min(start + len(phrase_tokens) + WINDOW_SLACK, len(words))
+            cost, first, last = self._align(index, words[lo:hi], said[lo:hi])
+            confidence = round(max(0.0, 1 - cost / len(phrase_tokens)), 3)
+            if confidence >= self.min_confidence and confidence > best.get(index, (0,))[-1]:
+                best[index] = (' '.join(said[lo + first:lo + last + 1]), confidence)
+        return {self.phrases[index]: match for index, match in best.items()}
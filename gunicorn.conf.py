@@ -0,0 +1,31 @@
+import os
+
+# The app is imported, and its heavy modules and language profiles loaded,
+# once in the master; workers are forked from it and share those pages.
+# create_app(preload=True) in wsgi.py relies on this.
+preload_app = True
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', 2))
+# Threads rather than sync workers: uploads are read in the request thread,
+# and /live holds a thread for the length of each call
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Long uploads on slow connections and long live calls
+timeout = int(os.environ.get('WEB_TIMEOUT', 300))
+
+
+def post_fork(server, worker):
+    # Start each worker's job queue now, so jobs interrupted by the last
+    # shutdown are resumed without waiting for the worker's first request
+    import app
+    app.get_job_queue()
+
+
+def child_exit(server, worker):
+    # A worker that exited (recycled, timed out or killed) leaves its
+    # unfinished jobs owned by a dead process; free them, and the live
+    # workers pick them up within app.JOB_RESUME_INTERVAL seconds
+    import app
+    from jobs import release_owner
+    release_owner(app.JOB_DB_PATH, worker.pid)
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class StageTimer:
+    # Records wall-clock time spent in each pipeline stage
+    def __init__(self, on_stage=None):
+        self.timings = {}
+        self.on_stage = on_stage
+
+    @contextmanager
+    def stage(self, name):
+        if self.on_stage:
+            self.on_stage(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 4)
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db(db_path):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                filename TEXT,
+                filepath TEXT,
+                timings TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                owner INTEGER
+            )
+        ''')
+        # Databases created before jobs had an owning process
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'owner' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN owner INTEGER')
+
+
+def release_interrupted(db_path):
+    # Frees the jobs left queued or running by the last shutdown for any
+    # process to resume. Only safe while no process is running jobs from
+    # db_path: at startup, once, before the server's workers start.
+    init_db(db_path)
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute('UPDATE jobs SET owner = NULL WHERE status IN (?, ?)', (QUEUED, RUNNING))
+
+
+def release_owner(db_path, owner):
+    # Frees the unfinished jobs of a process that has exited, e.g. a server
+    # worker that crashed, timed out or was recycled, for the live processes
+    # to resume (see JobQueue's resume_interval)
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute('UPDATE jobs SET owner = NULL WHERE owner = ? AND status IN (?, ?)', (owner, QUEUED, RUNNING))
+
+
+def prune_finished(db_path, before):
+    # Deletes the jobs that finished before the given time, with their
+    # results; returns how many were deleted
+    with closing(connect(db_path)) as conn, conn:
+        return conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+                            (DONE, FAILED, before)).rowcount
+
+
+class JobQueue:
+    # Runs the analysis pipeline on a bounded pool of worker threads.
+    # Job state lives in SQLite so no external broker is needed and
+    # results survive a restart. Each job is owned by the process running it,
+    # so several server worker processes can share one database.
+    def __init__(self, db_path, handler, max_workers=2, max_pending=100, release=True, resume_interval=None):
+        self.db_path = db_path
+        self.handler = handler
+        self.max_pending = max_pending
+        self.owner = os.getpid()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        init_db(db_path)
+        if release:
+            release_interrupted(db_path)
+        self._resume()
+        if resume_interval:
+            threading.Thread(target=self._resume_loop, args=(resume_interval,), name='job-resume', daemon=True).start()
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def _execute(self, sql, params=()):
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _resume(self):
+        # Jobs interrupted by a restart are picked up again from the start,
+        # each by whichever process claims it first
+        rows = self._execute('SELECT id, filepath, filename FROM jobs WHERE status IN (?, ?) AND owner IS NULL '
+                             'ORDER BY created_at', (QUEUED, RUNNING))
+        for row in rows:
+            with closing(self._connect()) as conn, conn:
+                claimed = conn.execute('UPDATE jobs SET status = ?, stage = NULL, owner = ? WHERE id = ? AND owner IS NULL',
+                                       (QUEUED, self.owner, row['id'])).rowcount
+            if claimed:
+                self._dispatch(row['id'], row['filepath'], row['filename'])
+
+    def _resume_loop(self, interval):
+        # Claims jobs released since startup, e.g. by release_owner
+        while True:
+            time.sleep(interval)
+            try:
+                self._resume()
+            except sqlite3.Error:
+                pass
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def submit(self, filepath, filename, job_id=None):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} jobs already waiting")
+            self._pending += 1
+        job_id = job_id or self.new_id()
+        self._execute('INSERT INTO jobs (id, status, filename, filepath, created_at, owner) VALUES (?, ?, ?, ?, ?, ?)',
+                      (job_id, QUEUED, filename, filepath, time.time(), self.owner))
+        self._executor.submit(self._run, job_id, filepath, filename)
+        return job_id
+
+    def _dispatch(self, job_id, filepath, filename):
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._run, job_id, filepath, filename)
+
+    def _run(self, job_id, filepath, filename):
+        def on_stage(name):
+            self._execute('UPDATE jobs SET stage = ? WHERE id = ?', (name, job_id))
+
+        timer = StageTimer(on_stage)
+        self._execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?', (RUNNING, time.time(), job_id))
+        try:
+            result = self.handler(filepath, filename, timer, job_id)
+        except Exception as e:
+            self._execute('UPDATE jobs SET status = ?, error = ?, timings = ?, finished_at = ? WHERE id = ?',
+                          (FAILED, f"{type(e).__name__}: {e}", json.dumps(timer.timings), time.time(), job_id))
+        else:
+            self._execute('UPDATE jobs SET status = ?, stage = NULL, result = ?, timings = ?, finished_at = ? WHERE id = ?',
+                          (DONE, json.dumps(result), json.dumps(timer.timings), time.time(), job_id))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        rows = self._execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['timings'] = json.loads(job['timings']) if job['timings'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.pop('result')
+        job.pop('filepath')
+        job.pop('owner')
+        return job
+
+    @property
+    def pending(self):
+        # Jobs submitted and not yet finished
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,94 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    # Aho-Corasick automaton over a fixed set of phrases. Built once, it finds
+    # every occurrence of every phrase (including overlapping ones) in a single
+    # pass over the text. Matching is case-insensitive.
+    def __init__(self, phrases):
+        self.phrases = list(dict.fromkeys(phrase.lower() for phrase in phrases))
+        goto = [{}]
+        outputs = [[]]
+
+        # Build the trie
+        for index, phrase in enumerate(self.phrases):
+            state = 0
+            for ch in phrase:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(index)
+
+        # Breadth-first pass computing failure links. Each state's transition
+        # table is completed from its failure state's table, so the scan is a
+        # single dict lookup per character; characters that appear in no
+        # phrase are absent and fall back to the root state.
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = dict(delta[fail[state]])
+            delta[state].update(goto[state])
+            for ch, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(ch, 0)
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+                queue.append(next_state)
+
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+        self._lengths = [len(phrase) for phrase in self.phrases]
+
+    def iter_matches(self, text):
+        # Yields (phrase, start) for each occurrence, in order of where it ends
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    yield self.phrases[index], i - self._lengths[index] + 1
+
+    def find(self, text):
+        # Maps each phrase found in the text to the start positions of its hits
+        matches = {}
+        for phrase, start in self.iter_matches(text):
+            matches.setdefault(phrase, []).append(start)
+        return matches
+
+    def stream(self):
+        return MatchStream(self)
+
+
+class MatchStream:
+    # Incremental scan for text that arrives in pieces, e.g. a live transcript.
+    # The automaton state carries over from one piece to the next, so each
+    # character is scanned once and phrases split across pieces still match.
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.state = 0
+        self.offset = 0
+
+    def feed(self, text):
+        # Returns [(phrase, start)] for occurrences ending in this piece, with
+        # start positions counted from the beginning of the whole stream
+        matcher = self.matcher
+        delta = matcher._delta
+        outputs = matcher._outputs
+        state = self.state
+        offset = self.offset
+        found = []
+        for i, ch in enumerate(text.lower(), offset):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    found.append((matcher.phrases[index], i - matcher._lengths[index] + 1))
+        self.state = state
+        self.offset = offset + len(text)
+        return found
@@ -0,0 +1,147 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from transcription import ChunkBuffer, to_audio_data
+
+# Live audio is cut into shorter chunks than uploads so the scorecard keeps
+# up with the conversation; a chunk ends at a pause 3 to 8 seconds in
+LIVE_CHUNK_MIN_SECONDS = 3
+LIVE_CHUNK_MAX_SECONDS = 8
+# Characters of earlier transcript searched again with each new piece, so an
+# agent name or account number split across two chunks is still found
+IDENTIFY_OVERLAP = 200
+
+
+class LiveScorecard:
+    # Running scorecard for a call in progress. Each piece of transcript is
+    # scanned once, continuing the keyword automaton from where the previous
+    # piece ended, and only criteria with a newly heard keyword are re-scored.
+    # scorecard() has the same shape as app.score_transcript on the whole text.
+    def __init__(self, matcher, criteria, keyword_table, outbound_markers, criterion_score, identifiers):
+        self.criteria = criteria
+        self.keyword_table = keyword_table
+        self.outbound_markers = set(marker.lower() for marker in outbound_markers)
+        self.criterion_score = criterion_score
+        # {field: (extract, patterns)}, e.g. app.extract_agent_name and NAME_PATTERNS
+        self.identifiers = identifiers
+        self.stream = matcher.stream()
+        self.pieces = []
+        self.heard = set()
+        self.criteria_by_keyword = {}
+        for criterion in criteria:
+            for keyword in keyword_table.get(criterion, []):
+                self.criteria_by_keyword.setdefault(keyword.lower(), []).append(criterion)
+        self.scores = {criterion: criterion_score('', keyword_table.get(criterion, []), weight, self.heard)
+                       for criterion, weight in criteria.items()}
+        self.identified = {field: extract('') for field, (extract, _) in identifiers.items()}
+        # Index of the pattern each field was found with; none yet
+        self._ranks = {field: len(patterns) for field, (_, patterns) in identifiers.items()}
+        self._tail = ''
+
+    @property
+    def text(self):
+        return ' '.join(self.pieces)
+
+    def add_text(self, text):
+        # Returns [(criterion, keyword)] for keywords heard for the first time
+        if not text:
+            return []
+        piece = (' ' if self.pieces else '') + text
+        self.pieces.append(text)
+        newly_heard = []
+        changed = set()
+        for phrase, _ in self.stream.feed(piece):
+            if phrase not in self.heard:
+                self.heard.add(phrase)
+                for criterion in self.criteria_by_keyword.get(phrase, []):
+                    newly_heard.append((criterion, phrase))
+                    changed.add(criterion)
+        for criterion in changed:
+            self.scores[criterion] = self.criterion_score(text, self.keyword_table.get(criterion, []),
+                                                          self.criteria.get(criterion, 0), self.heard)
+
+        self._identify(self._tail + piece)
+        self._tail = (self._tail + piece)[-IDENTIFY_OVERLAP:]
+        return newly_heard
+
+    def _identify(self, window):
+        # The extractors try their patterns in order over the whole transcript,
+        # so a later match of an earlier pattern wins over an earlier match of
+        # a later one. Only patterns ranked above the current match are tried.
+        for field, (extract, patterns) in self.identifiers.items():
+            unknown = extract('', [])
+            for rank in range(self._ranks[field]):
+                value = extract(window, patterns[rank:rank + 1])
+                if value != unknown:
+                    self.identified[field] = value
+                    self._ranks[field] = rank
+                    break
+
+    def scorecard(self):
+        return {
+            'agent': self.identified['agent'],
+            'call_type': "Outbound" if self.heard & self.outbound_markers else "Inbound",
+            'account': self.identified['account'],
+            'scores': dict(self.scores),
+        }
+
+    def missing(self):
+        # Weighted criteria with none of their keywords heard yet. Criteria
+        # without keywords are left out, as nothing said could satisfy them.
+        return [criterion for criterion, weight in self.criteria.items()
+                if weight and self.keyword_table.get(criterion) and not self.scores[criterion]]
+
+
+class LiveCall:
+    # Transcribes a live call as its audio arrives. add_audio() only buffers
+    # frames and hands finished chunks to worker threads, so it returns
+    # quickly; updates() collects transcribed chunks in order and feeds them
+    # to the scorecard.
+    def __init__(self, backend, scorecard, frame_rate=16000, sample_width=2, channels=1, max_workers=2):
+        self.backend = backend
+        self.scorecard = scorecard
+        self.chunks = ChunkBuffer(frame_rate, sample_width, channels, LIVE_CHUNK_MIN_SECONDS, LIVE_CHUNK_MAX_SECONDS)
+        self.segments = []
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='live')
+
+    def _transcribe(self, segment):
+        return self.backend.transcribe(to_audio_data(segment))
+
+    def _submit(self, chunks):
+        for start, end, segment in chunks:
+            self._pending.append((start, end, time.perf_counter(), self._executor.submit(self._transcribe, segment)))
+
+    def add_audio(self, data):
+        self._submit(self.chunks.add(data))
+
+    def updates(self, wait=False):
+        # One update per transcribed chunk, oldest first. Without `wait` only
+        # chunks that are already done are returned, so callers can poll.
+        updates = []
+        while self._pending and (wait or self._pending[0][3].done()):
+            start, end, submitted, future = self._pending.popleft()
+            text, error = future.result()
+            segment = {'start': round(start, 2), 'end': round(end, 2), 'text': text, 'error': error}
+            self.segments.append(segment)
+            newly_heard = self.scorecard.add_text(text)
+            scorecard = self.scorecard.scorecard()
+            updates.append({
+                'type': 'update',
+                'segment': segment,
+                'heard': [{'criterion': criterion, 'keyword': keyword} for criterion, keyword in newly_heard],
+                'scorecard': scorecard,
+                'total': sum(scorecard['scores'].values()),
+                'missing': [f"{criterion} not yet mentioned" for criterion in self.scorecard.missing()],
+                # From the chunk's last frame arriving to its score being ready
+                'latency_ms': round((time.perf_counter() - submitted) * 1000, 1),
+            })
+        return updates
+
+    def finish(self):
+        # Transcribes what is left in the buffer and returns the remaining updates
+        self._submit(self.chunks.flush())
+        updates = self.updates(wait=True)
+        self._executor.shutdown(wait=False)
+        return updates
@@ -0,0 +1,202 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+# Cell formats, created once per workbook from these specs
+FORMATS = {
+    'header': {'bold': True, 'bg_color': '#D3D3D3', 'border': 1},
+    'overall': {'bold': True, 'font_size': 14, 'align': 'center', 'valign': 'vcenter',
+                'bg_color': '#B8CCE4', 'border': 1},
+    'excellent': {'bg_color': '#C6EFCE'},          # Light green
+    'good': {'bg_color': '#FFEB9C'},               # Light yellow
+    'needs_improvement': {'bg_color': '#FFC7CE'},  # Light red
+}
+
+# (sheet name, column headers, column widths)
+SHEETS = [
+    ('Call Information', ['Field', 'Value'], [20, 80]),
+    ('Transcription', ['Original Text', 'Detected Language', 'English Translation'], [50, 15, 50]),
+    ('Scorecard', ['Criterion', 'Score', 'Comments'], [30, 20, 50]),
+    ('Improvement Plan', ['Suggestions for Improvement'], [80]),
+    ('Audio Quality', ['Metric', 'Value'], [30, 20]),
+    ('Reference Guide', ['Script Section', 'Description', 'Importance'], [25, 60, 20]),
+]
+
+# Reference sheet with script and scorecard information
+REFERENCE_GUIDE = [
+    ["Greeting", "Good morning/Afternoon/Good Evening, may I please speak to...", "Required"],
+    ["Call and Business Disclosure", "This call is being recorded for Quality and Security Purposes...", "Required (5%)"],
+    ["Authentication", "To ensure that I am speaking with the correct customer...", "Critical (20%)"],
+    ["Reason for the Call", "Mention the problem - missed/short payment, broken promise...", "Required"],
+    ["Obtaining reason for default", "Why did you fail to pay your instalment?", "Important (10%)"],
+    ["Negotiation", "Request payments in descending order: 100%, 30%, 10%", "Important (10%)"],
+    ["Forbearance", "Offer the forbs plan to account from D2D-D5D", "Important (10%)"],
+    ["NCA Disclaimer", "ABSA is legally required to provide an update of your credit record...", "Important (10%)"],
+    ["Payment Method", "Will you be paying via Cash deposit, internet banking...", "Required (5%)"],
+    ["CIF Confirmation", "Could we please confirm if we have your correct information?", "Important (10%)"],
+    ["Closing", "Recap the PTP date, amount, and payment method", "Required (5%)"]
+]
+
+
+# (metric key, label, unit) for the Audio Quality sheet, in display order
+AUDIO_QUALITY_ROWS = [
+    ('duration_seconds', "Duration", "s"),
+    ('speech_seconds', "Agent speech", "s"),
+    ('talk_ratio', "Agent talk ratio", "%"),
+    ('speaking_rate_wpm', "Speaking rate", "wpm"),
+    ('dead_air_count', "Dead air spans", ""),
+    ('dead_air_seconds', "Dead air total", "s"),
+    ('longest_dead_air_seconds', "Longest dead air", "s"),
+    ('loudness_dbfs', "Speech loudness", "dBFS"),
+    ('clipping_ratio', "Clipped samples", "%"),
+    ('interruptions', "Interruptions", ""),
+]
+
+
+def audio_quality(metrics):
+    # [label, value] rows; metrics that couldn't be measured for the call
+    # (e.g. talk ratio when the speakers weren't separated) are left out
+    if not metrics:
+        return [["Audio quality", "Not measured"]]
+    rows = []
+    for key, label, unit in AUDIO_QUALITY_ROWS:
+        value = metrics.get(key)
+        if value is None:
+            continue
+        if unit == '%':
+            value = f"{value * 100:.1f}%"
+        elif unit:
+            value = f"{value} {unit}"
+        rows.append([label, value])
+    return rows
+
+
+def call_information(analysis_data, original_text, call_metadata=None):
+    if call_metadata:
+        rows = [[key, value] for key, value in call_metadata.items()]
+    else:
+        rows = [
+            ["Analysis Date", datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
+            ["Analysis Type", "Call Quality Assessment"],
+            ["File Analyzed", "Unknown"],
+        ]
+
+        # Extract some basic metrics from the analysis data
+        for item in analysis_data:
+            if item[0] == "Agent Name":
+                rows.append(["Agent", item[2].replace("Agent identified as: ", "")])
+            elif item[0] == "Type of call":
+                rows.append(["Call Type", item[2].replace("Call type: ", "")])
+            elif item[0] == "Account number":
+                rows.append(["Account", item[2].replace("Account mentioned: ", "")])
+            elif item[0] == "OVERALL SCORE":
+                rows.append(["Overall Score", item[2]])
+
+    # Add the full transcript
+    rows.append(["Full Transcript", original_text])
+    return rows
+
+
+def scorecard_format(criterion, comments):
+    if criterion == "OVERALL SCORE":
+        return 'overall'
+    if "Excellent" in comments:
+        return 'excellent'
+    if "Good" in comments or "Average" in comments:
+        return 'good'
+    if "Needs improvement" in comments:
+        return 'needs_improvement'
+    return None
+
+
+def _write_row(worksheet, row, values, cell_format=None):
+    for col, value in enumerate(values):
+        if isinstance(value, str):
+            # write_string so transcript text starting with '=' is never a formula
+            worksheet.write_string(row, col, value, cell_format)
+        else:
+            worksheet.write(row, col, value, cell_format)
+
+
+def write_xlsx(path, data, analysis_data, improvement_suggestions, original_text, call_metadata=None,
+               audio_quality_metrics=None):
+    # Rows go straight into xlsxwriter in order, so constant_memory mode can
+    # flush each row to disk as soon as the next one starts. xlsxwriter is
+    # only imported here, as the JSON and CSV reports don't need it.
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    formats = {name: workbook.add_format(spec) for name, spec in FORMATS.items()}
+
+    sheets = {}
+    for name, headers, widths in SHEETS:
+        worksheet = workbook.add_worksheet(name)
+        for col, width in enumerate(widths):
+            worksheet.set_column(col, col, width)
+        _write_row(worksheet, 0, headers, formats['header'])
+        sheets[name] = worksheet
+
+    for row, values in enumerate(call_information(analysis_data, original_text, call_metadata), 1):
+        _write_row(sheets['Call Information'], row, values)
+
+    for row, values in enumerate(data, 1):
+        _write_row(sheets['Transcription'], row, values)
+
+    worksheet = sheets['Scorecard']
+    for row, (criterion, score, comments) in enumerate(analysis_data, 1):
+        name = scorecard_format(criterion, comments)
+        if name == 'overall':
+            # Merge cells and apply special format to overall score
+            worksheet.merge_range(row, 0, row, 2, f"OVERALL SCORE: {comments}", formats['overall'])
+        else:
+            _write_row(worksheet, row, (criterion, score, comments), formats.get(name))
+
+    for row, suggestion in enumerate(improvement_suggestions, 1):
+        _write_row(sheets['Improvement Plan'], row, [suggestion])
+
+    for row, values in enumerate(audio_quality(audio_quality_metrics), 1):
+        _write_row(sheets['Audio Quality'], row, values)
+
+    for row, values in enumerate(REFERENCE_GUIDE, 1):
+        _write_row(sheets['Reference Guide'], row, values)
+
+    workbook.close()
+    return path
+
+
+def write_csv(f, analysis_data):
+    # The scorecard as one Criterion,Score,Comments row per criterion
+    writer = csv.writer(f)
+    writer.writerow(['Criterion', 'Score', 'Comments'])
+    writer.writerows(analysis_data)
+
+
+def write_json(f, data, analysis_data, improvement_suggestions, original_text, call_metadata=None,
+               audio_quality_metrics=None):
+    json.dump({
+        'call_information': dict(call_information(analysis_data, original_text, call_metadata)),
+        'transcription': [
+            {'original_text': original, 'language': lang, 'translation': translation}
+            for original, lang, translation in data
+        ],
+        'scorecard': [
+            {'criterion': criterion, 'score': score, 'comments': comments}
+            for criterion, score, comments in analysis_data
+        ],
+        'improvement_suggestions': list(improvement_suggestions),
+        'audio_quality': audio_quality_metrics,
+    }, f, indent=2)
+
+
+def render(fmt, data, analysis_data, improvement_suggestions, original_text, call_metadata=None,
+           audio_quality_metrics=None):
+    # CSV or JSON report as a string, for machine consumers
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        write_csv(buffer, analysis_data)
+    elif fmt == 'json':
+        write_json(buffer, data, analysis_data, improvement_suggestions, original_text, call_metadata,
+                   audio_quality_metrics)
+    else:
+        raise ValueError(f"Unsupported report format {fmt!r}")
+    return buffer.getvalue()
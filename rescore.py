@@ -0,0 +1,238 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import app
+from fuzzy_matcher import FuzzyMatcher
+from store import AnalysisStore
+
+# Thresholds and labels of app.get_rating, highest first
+RATING_THRESHOLDS = [90, 80, 70, 60, 50]
+SCAN_BATCH_SIZE = 5000
+RATING_LABELS = ["Excellent", "Very Good", "Good", "Satisfactory", "Needs Improvement", "Unsatisfactory"]
+
+
+def ratings(percentages):
+    # Vectorized app.get_rating
+    return np.array(RATING_LABELS, dtype=object)[
+        np.select([percentages >= t for t in RATING_THRESHOLDS], range(len(RATING_THRESHOLDS)),
+                  default=len(RATING_THRESHOLDS))]
+
+
+def default_cache_path(db_path):
+    # The hit matrix lives next to the store it was built from
+    return os.path.splitext(db_path)[0] + '.rescore_hits.npz'
+
+
+def cache_file(cache_path):
+    # np.savez_compressed adds .npz to a path without it; loading has to
+    # look for the same file
+    return cache_path if cache_path.endswith('.npz') else cache_path + '.npz'
+
+
+def cache_identity(store, fuzzy=None):
+    # What a cached hit matrix must have been built from to be reused: this
+    # store (by path and by its store_id, in case it was recreated) and the
+    # same matching settings
+    return json.dumps({'store': os.path.realpath(store.db_path), 'store_id': store.store_id,
+                       'matching': f"fuzzy:{fuzzy.fingerprint}" if fuzzy else 'exact'}, sort_keys=True)
+
+
+def load_hit_matrix(store, call_ids, digests, keywords, cache_path=None, fuzzy=None):
+    # Boolean calls x keywords matrix: does the transcript contain the keyword
+    # (or, with a FuzzyMatcher, something close enough to it). `digests` are
+    # the calls' transcript digests. Columns and rows from a previous run on
+    # the same store are reused from cache_path, so only new keywords and new
+    # or changed transcripts have to be scanned.
+    cache_path = cache_file(cache_path) if cache_path else None
+    hits = np.zeros((len(call_ids), len(keywords)), dtype=bool)
+    known_rows = np.zeros(len(call_ids), dtype=bool)
+    known_cols = np.zeros(len(keywords), dtype=bool)
+
+    identity = cache_identity(store, fuzzy)
+    cached = _load_cache(cache_path, identity)
+    if cached is not None:
+        cached_ids = cached['call_ids']
+        cached_digests = cached['digests']
+        cached_keywords = list(cached['keywords'])
+        cached_hits = np.unpackbits(cached['hits'], axis=1, count=len(cached_keywords)).astype(bool)
+        # call_ids and cached_ids are both sorted; a row is only reused if
+        # its transcript is the one that was scanned
+        positions = np.searchsorted(cached_ids, call_ids).clip(max=max(len(cached_ids) - 1, 0))
+        if len(cached_ids):
+            known_rows = (cached_ids[positions] == call_ids) & (cached_digests[positions] == digests)
+        keyword_index = {keyword: i for i, keyword in enumerate(cached_keywords)}
+        for col, keyword in enumerate(keywords):
+            if keyword in keyword_index:
+                known_cols[col] = True
+                hits[known_rows, col] = cached_hits[positions[known_rows], keyword_index[keyword]]
+
+    # Scan transcripts only where the matrix has gaps: every keyword for calls
+    # not in the cache, and only the new keywords for the others
+    row_index = {call_id: i for i, call_id in enumerate(call_ids.tolist())}
+    new_cols = np.flatnonzero(~known_cols)
+    for rows_known, cols in ((False, np.arange(len(keywords))), (True, new_cols)):
+        scan_ids = call_ids[known_rows == rows_known]
+        if not len(cols) or not len(scan_ids):
+            continue
+        batch = []
+        for call_id, transcript in store.transcripts(scan_ids.tolist()):
+            batch.append((row_index[call_id], (transcript or '').lower()))
+            if len(batch) == SCAN_BATCH_SIZE:
+                _scan_batch(hits, batch, keywords, cols, fuzzy)
+                batch = []
+        _scan_batch(hits, batch, keywords, cols, fuzzy)
+
+    if cache_path:
+        np.savez_compressed(cache_path, call_ids=call_ids, digests=digests, keywords=np.array(keywords, dtype=str),
+                            hits=np.packbits(hits, axis=1), identity=np.array(identity))
+    return hits
+
+
+def _load_cache(cache_path, identity):
+    # The cached matrix, unless there is none or it was built from another
+    # store or with other matching settings (or before caches recorded that)
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    cached = np.load(cache_path, allow_pickle=False)
+    if 'identity' not in cached.files or str(cached['identity']) != identity:
+        return None
+    return cached
+
+
+def _scan_batch(hits, batch, keywords, cols, fuzzy=None):
+    if not batch:
+        return
+    rows = [row for row, _ in batch]
+    texts = [text for _, text in batch]
+    for col in cols:
+        keyword = keywords[col]
+        hits[rows, col] = [keyword in text for text in texts]
+    if fuzzy:
+        wanted = [keywords[col] for col in cols]
+        for row, text in batch:
+            found = fuzzy.find(text, skip=[keyword for col, keyword in zip(cols, wanted) if hits[row, col]])
+            for col, keyword in zip(cols, wanted):
+                if keyword in found:
+                    hits[row, col] = True
+
+
+def score_matrix(hits, keywords, criteria, keyword_table):
+    # Keyword hits x criterion membership gives matches per criterion; the
+    # same 0 / half / full weight rule as app.score_from_match_count applies
+    keyword_index = {keyword: i for i, keyword in enumerate(keywords)}
+    membership = np.zeros((len(keywords), len(criteria)), dtype=np.int32)
+    for col, criterion in enumerate(criteria):
+        for keyword in keyword_table.get(criterion, []):
+            membership[keyword_index[keyword.lower()], col] += 1
+    weights = np.array([criteria[criterion] for criterion in criteria], dtype=float)
+
+    matches = hits.astype(np.int32) @ membership
+    scores = np.where(matches >= 2, weights, np.where(matches == 1, weights * 0.5, 0.0))
+    scores[:, weights == 0] = 0
+    return scores, weights
+
+
+def apply_audio_scores(scores, calls, criteria):
+    # app.AUDIO_CRITERION is scored from the stored audio metrics for calls
+    # that have them, as app.score_transcript does, rather than from keywords
+    if app.AUDIO_CRITERION not in criteria:
+        return
+    col = list(criteria).index(app.AUDIO_CRITERION)
+    weight = criteria[app.AUDIO_CRITERION]
+    for row, call in enumerate(calls):
+        if call['audio_metrics']:
+            scores[row, col] = app.score_audio(call['audio_metrics'], weight)
+
+
+def load_scorecard(path):
+    # A what-if scorecard: {"criteria": {name: weight}, "keywords": {name: [phrases]}}
+    with open(path) as f:
+        scorecard = json.load(f)
+    return scorecard['criteria'], scorecard['keywords']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored transcripts with the current scorecard.")
+    parser.add_argument('--db', default=app.ANALYSIS_DB_PATH, help="Analysis store to re-score")
+    parser.add_argument('--scorecard', help="JSON file with 'criteria' and 'keywords' to use instead of app.py's")
+    parser.add_argument('--hits-cache',
+                        help="Keyword hit matrix reused between runs (default: next to --db, as .rescore_hits.npz)")
+    parser.add_argument('-o', '--output', default='rescore_diff.csv', help="Per-agent diff report")
+    parser.add_argument('--matching', choices=['exact', 'fuzzy'], default=app.KEYWORD_MATCHING,
+                        help="Keyword matching mode (default: KEYWORD_MATCHING)")
+    parser.add_argument('--apply', action='store_true', help="Write the new scores back to the store")
+    args = parser.parse_args(argv)
+
+    if args.scorecard:
+        criteria, keyword_table = load_scorecard(args.scorecard)
+    else:
+        criteria, keyword_table = app.SCORECARD_CRITERIA, app.KEYWORDS
+    keywords = list(dict.fromkeys(keyword.lower() for kws in keyword_table.values() for keyword in kws))
+
+    store = AnalysisStore(args.db)
+    start = time.perf_counter()
+    calls = store.all_calls()
+    if not calls:
+        print("No stored calls to re-score")
+        return 0
+    call_ids = np.array([call['id'] for call in calls], dtype=np.int64)
+    digests = np.array([call['transcript_digest'] or '' for call in calls], dtype=str)
+    agents = np.array([call['agent'] for call in calls], dtype=object)
+    old_totals = np.array([call['total_score'] for call in calls], dtype=float)
+    old_ratings = np.array([call['rating'] or app.get_rating(call['total_score']) for call in calls], dtype=object)
+    loaded = time.perf_counter()
+
+    fuzzy = FuzzyMatcher(keywords) if args.matching == 'fuzzy' else None
+    hits = load_hit_matrix(store, call_ids, digests, keywords, args.hits_cache or default_cache_path(args.db), fuzzy)
+    scanned = time.perf_counter()
+
+    scores, weights = score_matrix(hits, keywords, criteria, keyword_table)
+    apply_audio_scores(scores, calls, criteria)
+    new_totals = scores.sum(axis=1)
+    new_ratings = ratings(new_totals)  # Scores are out of 100, as in analyze_call_with_scorecard
+    scored = time.perf_counter()
+
+    # Per-agent diff: mean totals before and after, and how many calls changed rating
+    order = np.argsort(agents, kind='stable')
+    unique_agents, first = np.unique(agents[order].astype(str), return_index=True)
+    bounds = list(first[1:]) + [len(order)]
+    changed = old_ratings != new_ratings
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Agent', 'Calls', 'Old mean score', 'New mean score', 'Old rating', 'New rating',
+                         'Calls with changed rating'])
+        agents_changed = 0
+        for agent, lo, hi in zip(unique_agents, first, bounds):
+            rows = order[lo:hi]
+            old_mean = old_totals[rows].mean()
+            new_mean = new_totals[rows].mean()
+            old_rating, new_rating = app.get_rating(old_mean), app.get_rating(new_mean)
+            if old_rating != new_rating or changed[rows].any():
+                agents_changed += old_rating != new_rating
+                writer.writerow([agent, len(rows), round(old_mean, 2), round(new_mean, 2),
+                                 old_rating, new_rating, int(changed[rows].sum())])
+
+    print(f"Re-scored {len(calls)} calls: load {loaded - start:.2f}s, keyword scan {scanned - loaded:.2f}s, "
+          f"scoring {scored - scanned:.3f}s")
+    print(f"{int(changed.sum())} calls and {agents_changed} agents changed rating; diff written to {args.output}")
+
+    if args.apply:
+        names = list(criteria)
+        store.replace_scores(
+            ((int(call_id), agent, call['week'], float(total), rating, dict(zip(names, row.tolist())))
+             for call_id, agent, call, total, rating, row in zip(call_ids, agents, calls, new_totals, new_ratings, scores)),
+            criteria,
+            scorecard_version=app.scorecard_fingerprint(criteria, keyword_table, fuzzy)
+        )
+        print(f"Applied new scores to {args.db} in {time.perf_counter() - scored:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+LAST_USED_FILE = '.last_used'
+
+
+def file_digest(path, *salt):
+    digest = hashlib.sha256()
+    for value in salt:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\0')
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def json_digest(*values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    # Stage outputs stored on disk under the hash of the audio that produced
+    # them: <root>/<audio key>/<stage>. Stages that depend on the scorecard
+    # live in a sub-directory named after the scorecard's own hash, so a
+    # scorecard change misses only those stages.
+    # Entries are evicted whole, least recently used first, once they are
+    # older than max_age or the cache is larger than max_bytes.
+    def __init__(self, root, max_bytes=1024 ** 3, max_age=30 * 24 * 3600, evict_interval=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._last_evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, stage, scorecard=None):
+        parts = [self.root, key] + ([f"scorecard-{scorecard}"] if scorecard else []) + [stage]
+        return os.path.join(*parts)
+
+    def has(self, key, stage, scorecard=None):
+        return os.path.exists(self.path(key, stage, scorecard))
+
+    def touch(self, key):
+        marker = os.path.join(self.root, key, LAST_USED_FILE)
+        if os.path.isdir(os.path.dirname(marker)):
+            with open(marker, 'a'):
+                os.utime(marker)
+
+    def get_json(self, key, stage, scorecard=None):
+        try:
+            with open(self.path(key, stage, scorecard)) as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.touch(key)
+        return value
+
+    def put_json(self, key, stage, value, scorecard=None):
+        self._write(key, stage, scorecard, lambda f: f.write(json.dumps(value).encode('utf-8')))
+
+    def put_file(self, key, stage, source_path, scorecard=None):
+        def copy(f):
+            with open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        self._write(key, stage, scorecard, copy)
+        return self.path(key, stage, scorecard)
+
+    def _write(self, key, stage, scorecard, writer):
+        # Write to a temp file and rename so readers never see half an entry
+        target = self.path(key, stage, scorecard)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.touch(key)
+
+    def maybe_evict(self):
+        with self._lock:
+            if time.time() - self._last_evicted < self.evict_interval:
+                return
+            self._last_evicted = time.time()
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for key in os.listdir(self.root):
+            entry = os.path.join(self.root, key)
+            if not os.path.isdir(entry):
+                continue
+            size = 0
+            for dirpath, _, files in os.walk(entry):
+                for name in files:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, name))
+                    except OSError:
+                        pass
+            marker = os.path.join(entry, LAST_USED_FILE)
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else os.path.getmtime(entry)
+            entries.append((last_used, size, entry))
+            total += size
+
+        removed = 0
+        for last_used, size, entry in sorted(entries):
+            if now - last_used <= self.max_age and total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
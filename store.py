@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    call_key TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    agent TEXT NOT NULL,
+    account TEXT,
+    call_type TEXT,
+    created_at REAL NOT NULL,
+    week TEXT NOT NULL,
+    total_score REAL NOT NULL,
+    rating TEXT,
+    scorecard_version TEXT,
+    transcript TEXT,
+    transcript_digest TEXT,
+    audio_metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS calls_agent_created ON calls (agent, created_at);
+CREATE INDEX IF NOT EXISTS calls_created ON calls (created_at);
+CREATE INDEX IF NOT EXISTS calls_account ON calls (account);
+
+-- store_id: a random ID telling this store apart from any other, even one
+-- later created at the same path
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS criterion_scores (
+    call_id INTEGER NOT NULL REFERENCES calls (id) ON DELETE CASCADE,
+    criterion TEXT NOT NULL,
+    score REAL NOT NULL,
+    weight REAL NOT NULL,
+    agent TEXT NOT NULL,
+    week TEXT NOT NULL,
+    PRIMARY KEY (call_id, criterion)
+);
+CREATE INDEX IF NOT EXISTS criterion_scores_agent_week ON criterion_scores (agent, criterion, week);
+
+-- Running sums per agent, criterion and ISO week, kept up to date on every
+-- write so aggregate queries never scan the per-call rows
+CREATE TABLE IF NOT EXISTS criterion_weekly (
+    agent TEXT NOT NULL,
+    criterion TEXT NOT NULL,
+    week TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    weight_sum REAL NOT NULL,
+    PRIMARY KEY (agent, criterion, week)
+);
+CREATE INDEX IF NOT EXISTS criterion_weekly_week ON criterion_weekly (week, criterion);
+
+CREATE TABLE IF NOT EXISTS agent_weekly (
+    agent TEXT NOT NULL,
+    week TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    PRIMARY KEY (agent, week)
+);
+CREATE INDEX IF NOT EXISTS agent_weekly_week ON agent_weekly (week);
+'''
+
+
+def transcript_digest(transcript):
+    # Short hash identifying a transcript's text, e.g. to notice it changed
+    return hashlib.sha256(transcript.encode('utf-8')).hexdigest()[:16] if transcript is not None else None
+
+
+def iso_week(timestamp):
+    year, week, _ = datetime.fromtimestamp(timestamp).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class AnalysisStore:
+    # Scored calls in SQLite (WAL mode), one row per call plus one row per
+    # weighted criterion, with weekly rollups for the dashboard queries
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            # Stores created before calls had audio metrics or transcript digests
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(calls)')}
+            with conn:
+                if 'audio_metrics' not in columns:
+                    conn.execute('ALTER TABLE calls ADD COLUMN audio_metrics TEXT')
+                if 'transcript_digest' not in columns:
+                    conn.execute('ALTER TABLE calls ADD COLUMN transcript_digest TEXT')
+                    conn.executemany('UPDATE calls SET transcript_digest = ? WHERE id = ?',
+                                     [(transcript_digest(row['transcript']), row['id']) for row in
+                                      conn.execute('SELECT id, transcript FROM calls WHERE transcript IS NOT NULL')])
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+            self.store_id = conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()['value']
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _query(self, sql, params=()):
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def save_call(self, call_key, scorecard, weights, transcript=None, filename=None, rating=None,
+                  scorecard_version=None, created_at=None, audio_metrics=None):
+        # Inserts a scored call, or re-scores it if call_key is already stored
+        # (keeping its original timestamp), adjusting the rollups to match.
+        # audio_metrics is kept (as JSON) so re-scoring can use it.
+        scores = {criterion: score for criterion, score in scorecard['scores'].items() if weights.get(criterion)}
+        total = sum(scores.values())
+        with closing(self._connect()) as conn, conn:
+            old = conn.execute('SELECT id, agent, week, total_score, created_at FROM calls WHERE call_key = ?',
+                               (call_key,)).fetchone()
+            if old:
+                self._remove_from_rollups(conn, old)
+                created_at = old['created_at']
+            created_at = created_at or time.time()
+            week = iso_week(created_at)
+            conn.execute('''
+                INSERT INTO calls (call_key, filename, agent, account, call_type, created_at, week,
+                                   total_score, rating, scorecard_version, transcript, transcript_digest,
+                                   audio_metrics)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (call_key) DO UPDATE SET
+                    agent = excluded.agent, account = excluded.account, call_type = excluded.call_type,
+                    total_score = excluded.total_score, rating = excluded.rating,
+                    scorecard_version = excluded.scorecard_version,
+                    filename = COALESCE(excluded.filename, filename),
+                    transcript = COALESCE(excluded.transcript, transcript),
+                    transcript_digest = COALESCE(excluded.transcript_digest, transcript_digest),
+                    audio_metrics = COALESCE(excluded.audio_metrics, audio_metrics)
+            ''', (call_key, filename, scorecard['agent'], scorecard['account'], scorecard['call_type'],
+                  created_at, week, total, rating, scorecard_version, transcript, transcript_digest(transcript),
+                  json.dumps(audio_metrics) if audio_metrics else None))
+            call_id = conn.execute('SELECT id FROM calls WHERE call_key = ?', (call_key,)).fetchone()['id']
+            conn.execute('DELETE FROM criterion_scores WHERE call_id = ?', (call_id,))
+            conn.executemany(
+                'INSERT INTO criterion_scores (call_id, criterion, score, weight, agent, week) VALUES (?, ?, ?, ?, ?, ?)',
+                [(call_id, criterion, score, weights[criterion], scorecard['agent'], week)
+                 for criterion, score in scores.items()])
+            conn.executemany('''
+                INSERT INTO criterion_weekly (agent, criterion, week, calls, score_sum, weight_sum)
+                VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT (agent, criterion, week) DO UPDATE SET
+                    calls = calls + 1, score_sum = score_sum + excluded.score_sum,
+                    weight_sum = weight_sum + excluded.weight_sum
+            ''', [(scorecard['agent'], criterion, week, score, weights[criterion]) for criterion, score in scores.items()])
+            conn.execute('''
+                INSERT INTO agent_weekly (agent, week, calls, score_sum) VALUES (?, ?, 1, ?)
+                ON CONFLICT (agent, week) DO UPDATE SET
+                    calls = calls + 1, score_sum = score_sum + excluded.score_sum
+            ''', (scorecard['agent'], week, total))
+        return call_id
+
+    def _remove_from_rollups(self, conn, call):
+        rows = conn.execute('SELECT criterion, score, weight FROM criterion_scores WHERE call_id = ?',
+                            (call['id'],)).fetchall()
+        conn.executemany('''
+            UPDATE criterion_weekly SET calls = calls - 1, score_sum = score_sum - ?, weight_sum = weight_sum - ?
+            WHERE agent = ? AND criterion = ? AND week = ?
+        ''', [(row['score'], row['weight'], call['agent'], row['criterion'], call['week']) for row in rows])
+        conn.execute('UPDATE agent_weekly SET calls = calls - 1, score_sum = score_sum - ? WHERE agent = ? AND week = ?',
+                     (call['total_score'], call['agent'], call['week']))
+        conn.execute('DELETE FROM criterion_weekly WHERE calls <= 0 AND agent = ? AND week = ?',
+                     (call['agent'], call['week']))
+        conn.execute('DELETE FROM agent_weekly WHERE calls <= 0 AND agent = ? AND week = ?',
+                     (call['agent'], call['week']))
+
+    def all_calls(self):
+        # Every stored call without its transcript (but with its digest), in id order
+        calls = self._query('SELECT id, agent, week, total_score, rating, transcript_digest, audio_metrics '
+                            'FROM calls ORDER BY id')
+        for call in calls:
+            call['audio_metrics'] = json.loads(call['audio_metrics']) if call['audio_metrics'] else None
+        return calls
+
+    def transcripts(self, call_ids, batch_size=500):
+        # Yields (id, transcript) for the given calls, a batch at a time
+        call_ids = list(call_ids)
+        with closing(self._connect()) as conn:
+            for i in range(0, len(call_ids), batch_size):
+                batch = call_ids[i:i + batch_size]
+                placeholders = ','.join('?' * len(batch))
+                yield from conn.execute(f'SELECT id, transcript FROM calls WHERE id IN ({placeholders})', batch)
+
+    def replace_scores(self, rows, weights, scorecard_version=None):
+        # Bulk re-score: rows are (call_id, agent, week, total, rating, {criterion: score}).
+        # The rollups are rebuilt once at the end rather than adjusted per call.
+        with closing(self._connect()) as conn, conn:
+            for call_id, agent, week, total, rating, scores in rows:
+                conn.execute('UPDATE calls SET total_score = ?, rating = ?, scorecard_version = ? WHERE id = ?',
+                             (total, rating, scorecard_version, call_id))
+                conn.execute('DELETE FROM criterion_scores WHERE call_id = ?', (call_id,))
+                conn.executemany(
+                    'INSERT INTO criterion_scores (call_id, criterion, score, weight, agent, week) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(call_id, criterion, score, weights[criterion], agent, week)
+                     for criterion, score in scores.items() if weights.get(criterion)])
+            self._rebuild_rollups(conn)
+
+    def _rebuild_rollups(self, conn):
+        conn.execute('DELETE FROM criterion_weekly')
+        conn.execute('''
+            INSERT INTO criterion_weekly (agent, criterion, week, calls, score_sum, weight_sum)
+            SELECT agent, criterion, week, COUNT(*), SUM(score), SUM(weight)
+            FROM criterion_scores GROUP BY agent, criterion, week
+        ''')
+        conn.execute('DELETE FROM agent_weekly')
+        conn.execute('''
+            INSERT INTO agent_weekly (agent, week, calls, score_sum)
+            SELECT agent, week, COUNT(*), SUM(total_score) FROM calls GROUP BY agent, week
+        ''')
+
+    def calls(self, agent=None, since=None, until=None, limit=100):
+        where, params = self._filters(agent=agent, since=since, until=until)
+        return self._query(f'''
+            SELECT id, call_key, filename, agent, account, call_type, created_at, week, total_score, rating
+            FROM calls {where} ORDER BY created_at DESC LIMIT ?
+        ''', params + [limit])
+
+    def call(self, call_id):
+        rows = self._query('SELECT * FROM calls WHERE id = ?', (call_id,))
+        if not rows:
+            return None
+        call = rows[0]
+        call['audio_metrics'] = json.loads(call['audio_metrics']) if call['audio_metrics'] else None
+        call['criteria'] = self._query('SELECT criterion, score, weight FROM criterion_scores WHERE call_id = ?',
+                                       (call_id,))
+        return call
+
+    def criterion_weekly(self, agent=None, criterion=None, from_week=None, to_week=None):
+        # Mean score per criterion per agent per week, read from the rollup
+        where, params = self._filters(agent=agent, criterion=criterion, from_week=from_week, to_week=to_week)
+        return self._query(f'''
+            SELECT agent, criterion, week, calls,
+                   score_sum / calls AS mean_score,
+                   100.0 * score_sum / weight_sum AS mean_percent
+            FROM criterion_weekly {where}
+            ORDER BY week, agent, criterion
+        ''', params)
+
+    def agent_weekly(self, agent=None, from_week=None, to_week=None):
+        where, params = self._filters(agent=agent, from_week=from_week, to_week=to_week)
+        return self._query(f'''
+            SELECT agent, week, calls, score_sum / calls AS mean_score
+            FROM agent_weekly {where}
+            ORDER BY week, agent
+        ''', params)
+
+    def _filters(self, agent=None, criterion=None, since=None, until=None, from_week=None, to_week=None):
+        clauses, params = [], []
+        for column, op, value in (('agent', '=', agent), ('criterion', '=', criterion),
+                                  ('created_at', '>=', since), ('created_at', '<', until),
+                                  ('week', '>=', from_week), ('week', '<=', to_week)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# app.py creates its upload folder and databases relative to the working
+# directory when imported, so the tests run in a scratch directory with the
+# offline backends, set before anything imports it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['TRANSCRIPTION_BACKEND'] = 'fake'
+os.environ['TRANSLATION_BACKEND'] = 'fake'
+os.environ.pop('ANALYSIS_DB_PATH', None)
+os.environ.pop('KEYWORD_MATCHING', None)
+os.chdir(tempfile.mkdtemp(prefix='callanalysis-tests-'))
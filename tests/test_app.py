@@ -0,0 +1,64 @@
+import json
+import os
+import time
+
+import pytest
+
+import app
+import jobs
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def add_job(job_id, filename):
+    filepath = os.path.join(app.UPLOAD_FOLDER, f"{job_id}_{filename}")
+    with open(filepath, 'wb') as f:
+        f.write(b'RIFF')
+    app.get_job_queue()
+    with jobs.connect(app.JOB_DB_PATH) as conn:
+        conn.execute('INSERT INTO jobs (id, status, filename, filepath, created_at) VALUES (?, ?, ?, ?, ?)',
+                     (job_id, jobs.DONE, filename, filepath, time.time()))
+    return filepath
+
+
+def test_databases_are_not_in_the_upload_folder():
+    upload_folder = os.path.realpath(app.UPLOAD_FOLDER)
+    for path in (app.ANALYSIS_DB_PATH, app.JOB_DB_PATH, app.TRANSLATION_CACHE_PATH, app.RESULT_CACHE_DIR):
+        assert os.path.dirname(os.path.realpath(path)) != upload_folder
+
+
+def test_play_audio_serves_only_job_recordings(client):
+    filepath = add_job('a' * 32, 'call.wav')
+    assert client.get(f"/play_audio/{os.path.basename(filepath)}").status_code == 200
+
+    with open(os.path.join(app.UPLOAD_FOLDER, 'notes.db'), 'wb') as f:
+        f.write(b'secret')
+    for name in ('notes.db', 'analyses.db', 'jobs.db', f"{'b' * 32}_call.wav", f"{'a' * 32}_other.wav"):
+        assert client.get(f"/play_audio/{name}").status_code == 404
+
+    os.remove(filepath)
+    assert client.get(f"/play_audio/{os.path.basename(filepath)}").status_code == 404
+
+
+def test_api_calls_limit_is_clamped(client):
+    store = app.get_analysis_store()
+    for i in range(3):
+        store.save_call(f"limit-{i}", {'agent': 'Thabo', 'account': None, 'call_type': 'Inbound', 'scores': {}},
+                        app.SCORECARD_CRITERIA)
+    assert len(client.get('/api/calls?limit=-1').get_json()['calls']) == 1
+    assert len(client.get('/api/calls?limit=0').get_json()['calls']) == 1
+    assert len(client.get('/api/calls?limit=2').get_json()['calls']) == 2
+
+
+def test_results_page_hides_deleted_recording(client):
+    job_id = 'c' * 32
+    filepath = add_job(job_id, 'call.wav')
+    with jobs.connect(app.JOB_DB_PATH) as conn:
+        conn.execute('UPDATE jobs SET result = ? WHERE id = ?', (json.dumps({'audio_path': filepath}), job_id))
+    assert b'<audio' in client.get(f"/results/{job_id}").data
+
+    os.remove(filepath)
+    assert b'<audio' not in client.get(f"/results/{job_id}").data
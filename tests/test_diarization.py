@@ -0,0 +1,78 @@
+import io
+import wave
+
+import numpy as np
+
+import diarization
+
+
+def wav_file(samples, frame_rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(samples.astype('<i2').tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+def conversation(rng, channels, frame_rate=16000):
+    # Alternating loud and quiet turns with quiet pauses between them, and a
+    # few samples left over after the last whole analysis frame
+    parts = []
+    for turn in range(12):
+        speech = rng.standard_normal(int(rng.uniform(1, 2) * frame_rate)) * (8000 if turn % 2 else 1500)
+        parts += [speech, rng.standard_normal(int(rng.uniform(0.5, 1) * frame_rate)) * 30]
+    mono = np.concatenate(parts + [np.zeros(123)]).clip(-32768, 32767)
+    if channels == 1:
+        return mono[:, None]
+    return np.stack([mono, rng.standard_normal(len(mono)) * 30], axis=1)
+
+
+def read_tracks(tracks):
+    return {speaker: track.read() for speaker, track in tracks.items()}
+
+
+def test_block_size_does_not_change_tracks():
+    rng = np.random.default_rng(7)
+    for channels in (1, 2):
+        source = wav_file(conversation(rng, channels))
+        whole = diarization.scan(source, block_seconds=3600)
+        blocks = diarization.scan(source, block_seconds=0.7)
+        assert whole[:2] == blocks[:2] and whole[2][1:] == blocks[2][1:] and whole[3] == blocks[3]
+        np.testing.assert_allclose(whole[2][0], blocks[2][0])
+
+        turns = diarization.split_turns(whole[2][0], whole[1])
+        assert turns and len(turns) == 12
+        written = [read_tracks(diarization.write_tracks(source, whole[1], diarization.turn_speakers(turns),
+                                                        block_seconds=block_seconds)[0])
+                   for block_seconds in (3600, 0.7)]
+        assert written[0] == written[1]
+        assert source.tell() == 0
+
+
+def test_tracks_silence_the_other_speaker():
+    samples = conversation(np.random.default_rng(3), 1)
+    method, tracks, _ = diarization.diarize(wav_file(samples))
+    assert method == 'energy'
+    agent, customer = (np.frombuffer(wave.open(tracks[speaker], 'rb').readframes(len(samples)), dtype='<i2')
+                       for speaker in (diarization.AGENT, diarization.CUSTOMER))
+    assert len(agent) == len(customer) == len(samples)
+    assert not np.any((agent != 0) & (customer != 0))
+    assert np.percentile(np.abs(agent[agent != 0]), 50) > np.percentile(np.abs(customer[customer != 0]), 50)
+
+
+def test_levels_are_those_of_the_tracks():
+    # diarize measures each track as it writes it, or the whole call when it
+    # isn't split, so nothing needs reading again for the audio metrics
+    rng = np.random.default_rng(5)
+    for samples, mode, expected in ((conversation(rng, 1), 'auto', 'energy'), (conversation(rng, 2), 'auto', 'stereo'),
+                                    (conversation(rng, 1), 'off', None)):
+        source = wav_file(samples)
+        method, tracks, levels = diarization.diarize(source, mode)
+        assert method == expected
+        for speaker, track in (tracks or {diarization.AGENT: source}).items():
+            measured = diarization.frame_levels(track)
+            np.testing.assert_allclose(levels[speaker][0], measured[0], atol=1e-4)
+            assert levels[speaker][1:] == measured[1:]
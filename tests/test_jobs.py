@@ -0,0 +1,44 @@
+import os
+import time
+
+import jobs
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_live_queue_resumes_jobs_of_exited_worker(tmp_path):
+    # A job left running by a worker that has since exited, which a preloaded
+    # server's workers don't release at startup
+    db_path = str(tmp_path / 'jobs.db')
+    jobs.init_db(db_path)
+    with jobs.connect(db_path) as conn:
+        conn.execute('INSERT INTO jobs (id, status, filename, filepath, created_at, owner) VALUES (?, ?, ?, ?, ?, ?)',
+                     ('orphan', jobs.RUNNING, 'call.wav', 'call.wav', time.time(), os.getpid() + 100000))
+    ran = []
+    queue = jobs.JobQueue(db_path, lambda *args: ran.append(args[-1]) or {}, release=False, resume_interval=0.05)
+    time.sleep(0.2)
+    assert ran == []
+
+    jobs.release_owner(db_path, os.getpid() + 100000)
+    wait_for(lambda: queue.status('orphan')['status'] == jobs.DONE)
+    assert ran == ['orphan']
+
+
+def test_prune_finished_keeps_recent_and_unfinished_jobs(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    jobs.init_db(db_path)
+    now = time.time()
+    with jobs.connect(db_path) as conn:
+        for job_id, status, finished_at in (('old-done', jobs.DONE, now - 100), ('old-failed', jobs.FAILED, now - 100),
+                                            ('new-done', jobs.DONE, now), ('running', jobs.RUNNING, None)):
+            conn.execute('INSERT INTO jobs (id, status, filename, created_at, finished_at) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, status, 'call.wav', now - 200, finished_at))
+
+    assert jobs.prune_finished(db_path, now - 50) == 2
+    with jobs.connect(db_path) as conn:
+        assert {row['id'] for row in conn.execute('SELECT id FROM jobs')} == {'new-done', 'running'}
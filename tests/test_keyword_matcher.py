@@ -0,0 +1,57 @@
+import random
+import re
+
+import app
+from keyword_matcher import KeywordMatcher
+
+FILLER = ("the a and to we your payment today please call thank you sir madam is it ok yes no "
+          "rec record secure debit bank card credit bureau amount date pay arrears my this").split()
+NAMES = ["Thabo", "lerato", "JOHN", "Sipho"]
+
+
+def old_scorecard(text):
+    # Scoring as it was before the keyword matcher: a substring test per
+    # keyword and the identification regexes run on the lowercased text
+    text_lower = text.lower()
+    name = next((m.group(1).capitalize() for p in (r"my name is (\w+)", r"this is (\w+)", r"speaking with (\w+)")
+                 if (m := re.search(p, text_lower))), "Unknown")
+    account = next((m.group(1) for p in (r"account (\d+)", r"account number (\d+)", r"account #(\d+)")
+                    if (m := re.search(p, text_lower))), "Not mentioned")
+    call_type = "Outbound" if "outbound" in text_lower or "calling from" in text_lower else "Inbound"
+    scores = {}
+    for criterion, weight in app.SCORECARD_CRITERIA.items():
+        keywords = app.KEYWORDS.get(criterion, [])
+        scores[criterion] = 0 if weight == 0 else app.score_from_match_count(
+            sum(1 for keyword in keywords if keyword.lower() in text_lower), weight)
+    return {'agent': name, 'call_type': call_type, 'account': account, 'scores': scores}
+
+
+def random_transcript(rng):
+    keywords = [keyword for keywords in app.KEYWORDS.values() for keyword in keywords] + app.OUTBOUND_MARKERS
+    words = []
+    for _ in range(rng.randint(0, 120)):
+        roll = rng.random()
+        if roll < 0.15:
+            keyword = rng.choice(keywords)
+            # Whole keywords, in any case, and their first few letters
+            words.append(rng.choice([keyword, keyword.upper(), keyword.title(), keyword[:rng.randint(1, len(keyword))]]))
+        elif roll < 0.2:
+            words.append(rng.choice(["my name is", "this is", "speaking with"]) + " " + rng.choice(NAMES))
+        elif roll < 0.25:
+            words.append(rng.choice(["account", "account number", "account #"]) + f" {rng.randint(0, 99999)}")
+        else:
+            words.append(rng.choice(FILLER))
+    return rng.choice([' ', '', ', ', '. ']).join(words)
+
+
+def test_scores_match_per_keyword_scan():
+    rng = random.Random(2024)
+    for _ in range(2000):
+        text = random_transcript(rng)
+        assert app.score_transcript(text) == old_scorecard(text), text
+
+
+def test_finds_overlapping_phrases():
+    matcher = KeywordMatcher(["debit order", "order", "Bank Transfer", "transfer"])
+    found = matcher.find("Pay by DEBIT ORDER or bank transfer")
+    assert set(found) == {"debit order", "order", "bank transfer", "transfer"}
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app
+from test_keyword_matcher import random_transcript
+
+
+def split(text, rng):
+    # The transcript as the chunks a live call would hear it in, which
+    # LiveScorecard joins back with single spaces
+    words = text.split(' ')
+    cuts = sorted(rng.sample(range(1, len(words)), min(rng.randint(0, 8), len(words) - 1))) if len(words) > 1 else []
+    return [' '.join(words[start:end]) for start, end in zip([0] + cuts, cuts + [len(words)])]
+
+
+def test_live_scorecard_matches_score_transcript():
+    rng = random.Random(3000)
+    for _ in range(3000):
+        pieces = split(random_transcript(rng), rng)
+        scorecard = app.new_live_scorecard()
+        for piece in pieces:
+            scorecard.add_text(piece)
+        assert scorecard.scorecard() == app.score_transcript(scorecard.text), pieces
+
+
+@pytest.mark.parametrize('args', [{'channels': '0'}, {'channels': '3'}, {'sample_rate': '0'},
+                                  {'sample_rate': '96000'}, {'sample_width': '0'}, {'sample_width': '3'}])
+def test_live_audio_format_rejects_unsupported(args):
+    with pytest.raises(ValueError):
+        app.live_audio_format(MultiDict(args))
+
+
+def test_live_audio_format_defaults():
+    assert app.live_audio_format(MultiDict()) == (16000, 2, 1)
+    assert app.live_audio_format(MultiDict({'sample_rate': '8000', 'sample_width': '1', 'channels': '2'})) == \
+        (8000, 1, 2)
@@ -0,0 +1,134 @@
+import functools
+import os
+import random
+
+import pytest
+
+import app
+import rescore
+from fuzzy_matcher import FuzzyMatcher
+from store import AnalysisStore
+from test_keyword_matcher import random_transcript
+
+AUDIO = {'duration_seconds': 60.0, 'dead_air_seconds': 0.0, 'clipping_ratio': 0.0, 'loudness_dbfs': -50.0,
+         'speaking_rate_wpm': 150.0, 'talk_ratio': 0.5, 'interruptions': 0}
+
+
+def make_store(path, texts):
+    # Calls stored with every score zero, so only a re-score can get them right
+    store = AnalysisStore(path)
+    for i, text in enumerate(texts):
+        blank = {'agent': 'Agent', 'account': None, 'call_type': 'Inbound',
+                 'scores': dict.fromkeys(app.SCORECARD_CRITERIA, 0)}
+        store.save_call(f"call-{i}", blank, app.SCORECARD_CRITERIA, transcript=text,
+                        audio_metrics=AUDIO if i % 3 == 0 else None)
+    return store
+
+
+def assert_rescored(store):
+    # Every stored score is what scoring the transcript afresh gives
+    calls = store.all_calls()
+    assert calls
+    for call, (_, transcript) in zip(calls, store.transcripts([call['id'] for call in calls])):
+        expected = app.score_transcript(transcript, call['audio_metrics'])['scores']
+        stored = {row['criterion']: row['score'] for row in store.call(call['id'])['criteria']}
+        assert stored == {criterion: score for criterion, score in expected.items()
+                          if app.SCORECARD_CRITERIA[criterion]}, transcript
+        assert call['total_score'] == pytest.approx(sum(stored.values()))
+
+
+def run(tmp_path, db, *args):
+    assert rescore.main(['--db', db, '--apply', '-o', str(tmp_path / 'diff.csv'), *args]) == 0
+
+
+def texts(seed, count=150):
+    rng = random.Random(seed)
+    return [random_transcript(rng) for _ in range(count)]
+
+
+@pytest.mark.parametrize('matching', ['exact', 'fuzzy'])
+def test_matches_score_transcript(tmp_path, monkeypatch, matching):
+    monkeypatch.setattr(app, 'KEYWORD_MATCHING', matching)
+    db = str(tmp_path / 'calls.db')
+    store = make_store(db, texts(1))
+    run(tmp_path, db, '--matching', matching)
+    assert_rescored(store)
+    assert os.path.exists(rescore.default_cache_path(db))
+    # Again, from the cached hit matrix, after the scores were reset
+    make_store(db, texts(1))
+    run(tmp_path, db, '--matching', matching)
+    assert_rescored(store)
+
+
+def test_cache_is_not_shared_between_stores(tmp_path):
+    first, second = str(tmp_path / 'first.db'), str(tmp_path / 'second.db')
+    make_store(first, texts(2))
+    store = make_store(second, texts(3))  # Same call ids, other transcripts
+    run(tmp_path, first)
+    run(tmp_path, second)
+    assert_rescored(store)
+    assert rescore.default_cache_path(first) != rescore.default_cache_path(second)
+
+    # Even with one cache file given for both
+    shared = str(tmp_path / 'shared.npz')
+    make_store(str(tmp_path / 'third.db'), texts(4))
+    run(tmp_path, str(tmp_path / 'third.db'), '--hits-cache', shared)
+    store = make_store(str(tmp_path / 'fourth.db'), texts(5))
+    run(tmp_path, str(tmp_path / 'fourth.db'), '--hits-cache', shared)
+    assert_rescored(store)
+
+
+def test_changed_transcripts_are_rescanned(tmp_path):
+    db = str(tmp_path / 'calls.db')
+    original = texts(6)
+    store = make_store(db, original)
+    run(tmp_path, db)
+    # Same call keys, new transcripts: some of them change
+    make_store(db, [text if i % 2 else text[::-1] for i, text in enumerate(original)])
+    run(tmp_path, db)
+    assert_rescored(store)
+
+
+def test_fuzzy_settings_change_invalidates_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'KEYWORD_MATCHING', 'fuzzy')
+    db = str(tmp_path / 'calls.db')
+    store = make_store(db, texts(7))
+    run(tmp_path, db, '--matching', 'fuzzy')
+    strict = functools.partial(FuzzyMatcher, min_confidence=0.99)
+    monkeypatch.setattr(rescore, 'FuzzyMatcher', strict)
+    monkeypatch.setattr(app, 'FUZZY_MATCHER', strict(app.KEYWORD_MATCHER.phrases))
+    run(tmp_path, db, '--matching', 'fuzzy')
+    assert_rescored(store)
+
+
+def test_cache_path_without_npz_suffix_is_reused(tmp_path, monkeypatch):
+    db = str(tmp_path / 'calls.db')
+    store = make_store(db, texts(8))
+    run(tmp_path, db, '--hits-cache', str(tmp_path / 'hits.cache'))
+    assert os.path.exists(tmp_path / 'hits.cache.npz')
+
+    scanned = []
+    monkeypatch.setattr(rescore, '_scan_batch', lambda hits, batch, *args: scanned.extend(batch))
+    make_store(db, texts(8))
+    run(tmp_path, db, '--hits-cache', str(tmp_path / 'hits.cache'))
+    assert scanned == []
+    assert_rescored(store)
+
+
+@pytest.mark.parametrize('matching', ['exact', 'fuzzy'])
+def test_scorecard_version_is_the_app_fingerprint(tmp_path, monkeypatch, matching):
+    # Calls re-scored with the app's scorecard carry the same version as
+    # calls the app scores itself, fuzzy settings included
+    monkeypatch.setattr(app, 'KEYWORD_MATCHING', matching)
+    fuzzy = app.FUZZY_MATCHER if matching == 'fuzzy' else None
+    fingerprint = app.scorecard_fingerprint(app.SCORECARD_CRITERIA, app.KEYWORDS, fuzzy)
+    monkeypatch.setattr(app, 'SCORECARD_FINGERPRINT', fingerprint)
+    db = str(tmp_path / 'calls.db')
+    store = make_store(db, texts(9, count=5))
+    run(tmp_path, db, '--matching', matching)
+    versions = {row['scorecard_version'] for row in store._query('SELECT scorecard_version FROM calls')}
+    assert versions == {app.SCORECARD_FINGERPRINT}
+
+    monkeypatch.setattr('fuzzy_matcher.MAX_TOKEN_EDITS', 0)
+    changed = app.scorecard_fingerprint(app.SCORECARD_CRITERIA, app.KEYWORDS, fuzzy)
+    assert (changed != app.SCORECARD_FINGERPRINT) == (matching == 'fuzzy')
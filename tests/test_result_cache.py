@@ -0,0 +1,65 @@
+import os
+import time
+import wave
+
+import numpy as np
+
+import app
+from result_cache import LAST_USED_FILE, ResultCache
+
+
+def add_entry(cache, key, size, last_used):
+    cache.put_json(key, 'transcript.json', 'x' * size)
+    marker = os.path.join(cache.root, key, LAST_USED_FILE)
+    os.utime(marker, (last_used, last_used))
+
+
+def keys(cache):
+    return sorted(os.listdir(cache.root))
+
+
+def test_evicts_least_recently_used_until_under_size(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=2500)
+    now = time.time()
+    for i, key in enumerate(['a', 'b', 'c', 'd']):
+        add_entry(cache, key, 1000, now - 100 + i)
+    # Reading an entry makes it the most recently used
+    assert cache.get_json('a', 'transcript.json')
+    assert cache.evict() == 2
+    assert keys(cache) == ['a', 'd']
+
+
+def test_evicts_entries_older_than_max_age(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 ** 6, max_age=3600)
+    now = time.time()
+    add_entry(cache, 'old', 10, now - 7200)
+    add_entry(cache, 'recent', 10, now - 60)
+    assert cache.evict() == 1
+    assert keys(cache) == ['recent']
+    assert cache.evict() == 0
+
+
+def test_scorecard_change_reuses_transcript(tmp_path, monkeypatch):
+    path = str(tmp_path / 'call.wav')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes((np.random.default_rng(1).standard_normal(16000 * 5) * 3000).astype('<i2').tobytes())
+    monkeypatch.setattr(app, 'result_cache', ResultCache(str(tmp_path / 'cache')))
+    first = app.run_pipeline(path, 'call.wav')
+    assert first['cache_hits'] == []
+
+    def no_transcription(*args, **kwargs):
+        raise AssertionError("transcribed again")
+    monkeypatch.setattr(app, 'transcribe_call', no_transcription)
+    monkeypatch.setattr(app, 'SCORECARD_FINGERPRINT', 'edited-scorecard')
+    second = app.run_pipeline(path, 'call.wav')
+    assert second['cache_hits'] == ['transcribe', 'process_text']
+    assert second['original_text'] == first['original_text'] and second['scorecard'] == 'edited-scorecard'
+    cache = app.get_result_cache()
+    assert cache.has(first['cache_key'], 'analysis.json', first['scorecard'])
+    assert cache.has(first['cache_key'], 'analysis.json', 'edited-scorecard')
+
+    # And unchanged, everything comes from the cache
+    assert app.run_pipeline(path, 'call.wav')['cache_hits'] == ['transcribe', 'process_text', 'analyze']
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from store import AnalysisStore
+
+WEIGHTS = {'Greeting': 10, 'Authentication': 20, 'Recap': 5, 'Agent Name': 0}
+AGENTS = ['Thabo', 'Lerato', 'Sipho']
+# Timestamps spread over a few ISO weeks
+START = 1_700_000_000
+WEEK = 7 * 24 * 3600
+
+
+def random_scorecard(rng):
+    return {'agent': rng.choice(AGENTS), 'account': None, 'call_type': 'Inbound',
+            'scores': {criterion: rng.choice([0, weight / 2, weight]) for criterion, weight in WEIGHTS.items()}}
+
+
+def assert_rollups_match(store):
+    # The running sums equal aggregating the per-call rows afresh
+    criterion_rollup = store._query('SELECT agent, criterion, week, calls, score_sum, weight_sum FROM criterion_weekly '
+                                    'ORDER BY agent, criterion, week')
+    criterion_expected = store._query('SELECT agent, criterion, week, COUNT(*) AS calls, SUM(score) AS score_sum, '
+                                      'SUM(weight) AS weight_sum FROM criterion_scores '
+                                      'GROUP BY agent, criterion, week ORDER BY agent, criterion, week')
+    assert criterion_rollup == pytest.approx(criterion_expected)
+    agent_rollup = store._query('SELECT agent, week, calls, score_sum FROM agent_weekly ORDER BY agent, week')
+    agent_expected = store._query('SELECT agent, week, COUNT(*) AS calls, SUM(total_score) AS score_sum FROM calls '
+                                  'GROUP BY agent, week ORDER BY agent, week')
+    assert agent_rollup == pytest.approx(agent_expected)
+    assert agent_rollup
+
+
+def test_rollups_follow_inserts_resaves_and_replace_scores(tmp_path):
+    rng = random.Random(11)
+    store = AnalysisStore(str(tmp_path / 'analyses.db'))
+    for i in range(60):
+        store.save_call(f"call-{i}", random_scorecard(rng), WEIGHTS, created_at=START + rng.randrange(4 * WEEK))
+    assert_rollups_match(store)
+
+    # Saved again, often under another agent; the call keeps its week
+    for i in rng.sample(range(60), 30):
+        store.save_call(f"call-{i}", random_scorecard(rng), WEIGHTS)
+    assert_rollups_match(store)
+    assert len(store.all_calls()) == 60
+
+    rows = []
+    for call in store.all_calls():
+        scores = {criterion: rng.choice([0, weight]) for criterion, weight in WEIGHTS.items()}
+        rows.append((call['id'], call['agent'], call['week'], sum(scores.values()), None, scores))
+    store.replace_scores(rows, WEIGHTS)
+    assert_rollups_match(store)
+
+    # And incremental updates on top of the rebuilt rollups
+    store.save_call('call-0', random_scorecard(rng), WEIGHTS)
+    store.save_call('call-new', random_scorecard(rng), WEIGHTS, created_at=START)
+    assert_rollups_match(store)
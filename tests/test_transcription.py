@@ -0,0 +1,79 @@
+import io
+import wave
+
+import numpy as np
+
+from transcription import FakeBackend, transcribe_chunked
+
+
+def recording(seconds=200, frame_rate=16000):
+    # Noise with a pause every few seconds, and a stretch of digital silence
+    rng = np.random.default_rng(11)
+    samples = (rng.standard_normal(seconds * frame_rate) * 3000).astype('<i2')
+    for start in range(0, len(samples), 7 * frame_rate):
+        samples[start:start + frame_rate // 2] //= 100
+    samples[60 * frame_rate:100 * frame_rate] = 0
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(samples.tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.batches = []
+
+    def transcribe_batch(self, audio_datas):
+        self.batches.append(len(audio_datas))
+        return super().transcribe_batch(audio_datas)
+
+
+def test_batches_give_the_same_segments():
+    one = CountingBackend(batch_size=1)
+    expected = transcribe_chunked(recording(), one)
+    assert len(expected) > 6 and all(count == 1 for count in one.batches)
+    silent = sum(1 for segment in expected if not segment['text'])
+    assert silent and len(one.batches) == len(expected) - silent
+
+    for batch_size in (3, 4, 100):
+        backend = CountingBackend(batch_size=batch_size)
+        assert transcribe_chunked(recording(), backend, max_workers=2) == expected
+        assert max(backend.batches) <= batch_size and sum(backend.batches) == len(expected) - silent
+        assert len(backend.batches) < len(one.batches)
+
+
+class FlakyBackend(FakeBackend):
+    # Fails each chunk the first `failures` times it is sent
+    def __init__(self, failures, **options):
+        super().__init__(**options)
+        self.failures = failures
+        self.sent = {}
+
+    def transcribe_batch(self, audio_datas):
+        results = super().transcribe_batch(audio_datas)
+        out = []
+        for audio_data, result in zip(audio_datas, results):
+            key = audio_data.get_raw_data()
+            self.sent[key] = self.sent.get(key, 0) + 1
+            out.append(('', 'Could not request results; timed out') if self.sent[key] <= self.failures else result)
+        return out
+
+
+def test_failed_chunks_are_retried():
+    expected = transcribe_chunked(recording(), FakeBackend())
+    flaky = transcribe_chunked(recording(), FlakyBackend(2, batch_size=3), backoff=0)
+    assert [segment['text'] for segment in flaky] == [segment['text'] for segment in expected]
+    assert not any(segment['error'] for segment in flaky)
+    assert {segment['attempts'] for segment in flaky} == {0, 3}
+    assert [segment['attempts'] == 0 for segment in flaky] == [not segment['text'] for segment in expected]
+
+
+def test_chunks_failing_every_retry_keep_their_error():
+    segments = transcribe_chunked(recording(), FlakyBackend(3), retries=2, backoff=0)
+    spoken = [segment for segment in segments if segment['attempts']]
+    assert spoken and all(segment['error'] and segment['attempts'] == 3 for segment in spoken)
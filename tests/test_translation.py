@@ -0,0 +1,85 @@
+import pytest
+
+import translation
+from translation import TranslationCache, Translator
+
+SENTENCES = [f"phrase numero {i}" for i in range(16)]
+
+
+class JoiningClient:
+    # Translates, but returns the whole request on one line
+    requests = []
+
+    def translate(self, text):
+        JoiningClient.requests.append(text)
+        return text.upper().replace('\n', ' ')
+
+
+class MisaligningClient:
+    # Keeps line breaks, except that one sentence comes back split in two
+    requests = []
+
+    def translate(self, text):
+        MisaligningClient.requests.append(text)
+        return text.upper().replace('NUMERO 5', 'NUMERO\n5')
+
+
+class FailingClient:
+    requests = []
+
+    def translate(self, text):
+        FailingClient.requests.append(text)
+        raise ConnectionError("service unavailable")
+
+
+@pytest.fixture
+def make_translator(tmp_path, monkeypatch):
+    def make(client):
+        client.requests = []
+        monkeypatch.setitem(translation.CLIENTS, client.__name__, client)
+        translator = Translator(TranslationCache(str(tmp_path / f"{client.__name__}.db")), client.__name__)
+        monkeypatch.setattr(translator, 'detect_languages', lambda sentences: dict.fromkeys(sentences, 'fr'))
+        return translator
+    return make
+
+
+def cached(translator, sentences):
+    return translator.cache.get_many([(sentence, 'fr') for sentence in sentences])
+
+
+def test_dropped_line_breaks_fall_back_to_single_sentences(make_translator):
+    translator = make_translator(JoiningClient)
+    stats = {}
+    results = translator.translate(SENTENCES, stats)
+    assert [translated for _, _, translated in results] == [sentence.upper() for sentence in SENTENCES]
+    # The batch, then each sentence on its own
+    assert stats['translate_requests'] == 1 + len(SENTENCES) and stats['translate_failures'] == 0
+    assert cached(translator, SENTENCES) == {(sentence, 'fr'): sentence.upper() for sentence in SENTENCES}
+
+    # Later sentences in that language skip the batch that can't work
+    more = [f"autre phrase {i}" for i in range(5)]
+    stats = {}
+    translator.translate(more, stats)
+    assert stats['translate_requests'] == len(more) and JoiningClient.requests[-len(more):] == more
+
+
+def test_misaligned_batch_is_halved(make_translator):
+    translator = make_translator(MisaligningClient)
+    stats = {}
+    results = translator.translate(SENTENCES, stats)
+    expected = [None if sentence == "phrase numero 5" else sentence.upper() for sentence in SENTENCES]
+    assert [translated if translated != original else None for original, _, translated in results] == expected
+    # 16 -> 8 -> 4 -> 2 -> 1: two requests per level down to the sentence
+    assert stats['translate_requests'] == 9 and stats['translate_failures'] == 1
+    assert cached(translator, SENTENCES) == {(sentence, 'fr'): translated
+                                             for sentence, translated in zip(SENTENCES, expected) if translated}
+    assert not translator.unbatched_languages
+
+
+def test_failed_request_is_not_retried(make_translator):
+    translator = make_translator(FailingClient)
+    stats = {}
+    results = translator.translate(SENTENCES, stats)
+    assert [translated for _, _, translated in results] == SENTENCES
+    assert stats['translate_requests'] == 1 and stats['translate_failures'] == len(SENTENCES)
+    assert cached(translator, SENTENCES) == {}
@@ -0,0 +1,318 @@
+import json
+import os
+import threading
+import time
+import wave
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# speech_recognition and pydub are imported where they're used, so importing
+# this module (and the app) doesn't pay for them until the first call
+
+# Chunks are cut at a pause between MIN and MAX seconds into the buffered
+# audio; if there is no pause the chunk is cut hard at MAX seconds
+CHUNK_MIN_SECONDS = 10
+CHUNK_MAX_SECONDS = 30
+MIN_SILENCE_MS = 300
+SILENCE_SEEK_STEP_MS = 10
+SILENCE_BELOW_AVERAGE_DB = 16
+# A chunk the engine fails on (e.g. a RequestError from a network blip) is
+# retried this many times, waiting RETRY_BACKOFF_SECONDS, then twice as
+# long each time, before the recording counts as incomplete
+CHUNK_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1
+
+# 8-bit WAV samples are unsigned; everything downstream expects signed
+_UNSIGNED_TO_SIGNED = bytes((b - 128) & 0xFF for b in range(256))
+
+
+def iter_chunks(source, min_seconds=CHUNK_MIN_SECONDS, max_seconds=CHUNK_MAX_SECONDS):
+    # Reads a WAV file (path or file object) and yields (start, end, segment)
+    # for silence-aware chunks. Only about one chunk of audio is held at a time.
+    with wave.open(source, 'rb') as wav:
+        chunks = ChunkBuffer(wav.getframerate(), wav.getsampwidth(), wav.getnchannels(), min_seconds, max_seconds)
+        while True:
+            data = wav.readframes(chunks.frames_wanted())
+            if not data:
+                # End of file: whatever is left is the last chunk
+                yield from chunks.flush()
+                return
+            yield from chunks.add(data)
+
+
+class ChunkBuffer:
+    # Silence-aware chunking for audio pushed in as it arrives: add() takes
+    # raw frames and returns the (start, end, segment) chunks that are ready,
+    # each cut at a pause between min_seconds and max_seconds into the buffer
+    def __init__(self, frame_rate, sample_width, channels, min_seconds=CHUNK_MIN_SECONDS,
+                 max_seconds=CHUNK_MAX_SECONDS):
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.min_seconds = min_seconds
+        self.frame_size = channels * sample_width
+        self.max_bytes = int(max_seconds * frame_rate) * self.frame_size
+        self.start = 0.0
+        self._buffer = b''
+
+    def frames_wanted(self):
+        # Frames that can be added before a chunk has to be cut
+        return (self.max_bytes - len(self._buffer)) // self.frame_size
+
+    def _segment(self, data):
+        from pydub import AudioSegment
+        return AudioSegment(data=data, sample_width=self.sample_width, frame_rate=self.frame_rate,
+                            channels=self.channels)
+
+    def _take(self, size):
+        chunk = self._segment(self._buffer[:size])
+        self._buffer = self._buffer[size:]
+        start = self.start
+        self.start += chunk.duration_seconds
+        return start, self.start, chunk
+
+    def add(self, data):
+        if self.sample_width == 1:
+            data = data.translate(_UNSIGNED_TO_SIGNED)
+        self._buffer += data
+        ready = []
+        while len(self._buffer) >= self.max_bytes:
+            cut_ms = _find_cut(self._segment(self._buffer[:self.max_bytes]), self.min_seconds)
+            ready.append(self._take(int(cut_ms * self.frame_rate / 1000) * self.frame_size))
+        return ready
+
+    def flush(self):
+        # The rest of the buffer as a final chunk, if there is any
+        size = len(self._buffer) - len(self._buffer) % self.frame_size
+        return [self._take(size)] if size else []
+
+
+def _find_cut(segment, min_seconds):
+    # Cut in the middle of the longest pause after min_seconds
+    from pydub.silence import detect_silence
+    offset = int(min_seconds * 1000)
+    silences = detect_silence(segment[offset:], min_silence_len=MIN_SILENCE_MS,
+                              silence_thresh=segment.dBFS - SILENCE_BELOW_AVERAGE_DB,
+                              seek_step=SILENCE_SEEK_STEP_MS)
+    if not silences:
+        return len(segment)
+    silence_start, silence_end = max(silences, key=lambda s: s[1] - s[0])
+    return offset + (silence_start + silence_end) // 2
+
+
+def to_audio_data(segment):
+    import speech_recognition as sr
+    segment = segment.set_channels(1)
+    return sr.AudioData(segment.raw_data, segment.frame_rate, segment.sample_width)
+
+
+class TranscriptionBackend:
+    # Base class for speech recognition engines. Each backend instance allows
+    # at most max_concurrency recognitions at once across all callers.
+    # transcribe_chunked hands chunks over batch_size at a time; engines with
+    # a setup cost per recognition share it across a batch (see recognizer).
+    name = None
+    max_concurrency = 4
+    batch_size = 1
+
+    def __init__(self, max_concurrency=None, batch_size=None):
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        if batch_size:
+            self.batch_size = batch_size
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def recognize(self, audio_data):
+        raise NotImplementedError
+
+    def recognizer(self):
+        # Returns a function recognizing one chunk, used for every chunk of a
+        # batch; engines that load a decoder set it up here, once per batch
+        return self.recognize
+
+    def transcribe(self, audio_data):
+        # Returns (text, error); audio with no recognizable speech is ''
+        return self.transcribe_batch([audio_data])[0]
+
+    def transcribe_batch(self, audio_datas):
+        # [(text, error)] per chunk, recognized in turn with one recognizer
+        # while holding one concurrency slot
+        import speech_recognition as sr
+        results = []
+        with self._slots:
+            recognize = self.recognizer()
+            for audio_data in audio_datas:
+                try:
+                    results.append((recognize(audio_data), None))
+                except sr.UnknownValueError:
+                    results.append(('', None))
+                except sr.RequestError as e:
+                    results.append(('', str(e) or type(e).__name__))
+        return results
+
+
+class GoogleBackend(TranscriptionBackend):
+    name = 'google'
+
+    def recognize(self, audio_data):
+        import speech_recognition as sr
+        return sr.Recognizer().recognize_google(audio_data)
+
+
+class SphinxBackend(TranscriptionBackend):
+    # Offline, via speech_recognition's PocketSphinx integration. CPU bound,
+    # so concurrency defaults to the number of cores.
+    name = 'sphinx'
+    max_concurrency = os.cpu_count() or 1
+
+    def recognize(self, audio_data):
+        import speech_recognition as sr
+        return sr.Recognizer().recognize_sphinx(audio_data)
+
+
+class VoskBackend(TranscriptionBackend):
+    # Offline, via Vosk. The model is loaded once and shared by all chunks,
+    # and each batch of chunks reuses one recognizer: FinalResult ends a
+    # chunk and the next one starts a new utterance.
+    name = 'vosk'
+    max_concurrency = os.cpu_count() or 1
+    batch_size = 8
+    sample_rate = 16000
+
+    def __init__(self, max_concurrency=None, batch_size=None, model_path=None):
+        super().__init__(max_concurrency, batch_size)
+        from vosk import Model
+        self.model = Model(model_path or os.environ.get('VOSK_MODEL_PATH', 'model'))
+
+    def recognizer(self):
+        import speech_recognition as sr
+        from vosk import KaldiRecognizer
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+
+        def recognize(audio_data):
+            recognizer.AcceptWaveform(audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+            text = json.loads(recognizer.FinalResult()).get('text', '')
+            if not text:
+                raise sr.UnknownValueError()
+            return text
+        return recognize
+
+    def recognize(self, audio_data):
+        return self.recognizer()(audio_data)
+
+
+class FakeBackend(TranscriptionBackend):
+    # Deterministic stand-in for load tests and CI: picks a fixture transcript
+    # from a hash of the audio, so the same audio always gives the same text.
+    # Fixtures are the .txt files in fixtures_dir, or a built-in set.
+    name = 'fake'
+    max_concurrency = 16
+    batch_size = 4
+    default_fixtures = [
+        "Good morning, my name is Thabo calling from the collections department regarding your account 40512 "
+        "this call is recorded for quality and security purposes and we are a registered credit provider",
+        "Could you please verify your details, your date of birth and residential address. "
+        "I understand the financial strain, can we negotiate an instalment amount on the arrears amount",
+        "Will you be paying via debit order or bank transfer. We are legally required to update your credit record "
+        "with the credit bureau and a missed or late payment will affect this record",
+        "Let me recap the arrangement, the PTP date is Friday and the amount is paid by cash deposit, "
+        "thank you for your time and I appreciate your assistance",
+    ]
+
+    def __init__(self, max_concurrency=None, batch_size=None, fixtures_dir=None, latency=None):
+        super().__init__(max_concurrency, batch_size)
+        fixtures_dir = fixtures_dir or os.environ.get('FAKE_TRANSCRIPTS_DIR')
+        if fixtures_dir:
+            self.fixtures = []
+            for name in sorted(os.listdir(fixtures_dir)):
+                if name.endswith('.txt'):
+                    with open(os.path.join(fixtures_dir, name)) as f:
+                        self.fixtures.append(f.read().strip())
+        else:
+            self.fixtures = list(self.default_fixtures)
+        # Simulated seconds of recognition per second of audio
+        self.latency = float(latency if latency is not None else os.environ.get('FAKE_TRANSCRIPTION_LATENCY', 0))
+
+    def recognize(self, audio_data):
+        import speech_recognition as sr
+        if self.latency:
+            time.sleep(self.latency * len(audio_data.frame_data) / (audio_data.sample_rate * audio_data.sample_width))
+        if not self.fixtures or not audio_data.frame_data.strip(b'\0'):
+            raise sr.UnknownValueError()
+        return self.fixtures[zlib.crc32(audio_data.frame_data) % len(self.fixtures)]
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, SphinxBackend, VoskBackend, FakeBackend)}
+
+
+def create_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
+
+
+class IncompleteTranscription(Exception):
+    # Some chunks of a recording couldn't be transcribed (the recognizer
+    # failed on them), so the text would be missing parts of the call
+    def __init__(self, segments):
+        failed = [segment for segment in segments if segment['error']]
+        self.segments = segments
+        super().__init__(f"{len(failed)} of {len(segments)} chunks could not be transcribed: {failed[0]['error']}")
+
+
+def check_complete(segments):
+    # Raises IncompleteTranscription if any chunk from transcribe_chunked failed
+    if any(segment['error'] for segment in segments):
+        raise IncompleteTranscription(segments)
+
+
+def transcribe_chunked(source, backend, max_workers=4, retries=CHUNK_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    # Transcribes chunks concurrently, in batches of backend.batch_size, and
+    # returns them in order as [{'start', 'end', 'text', 'error', 'attempts'}];
+    # see check_complete. Failed chunks are retried with backoff, and only
+    # the last attempt's error is kept. At most max_workers batches are
+    # being transcribed and as many more decoded and waiting at any time, so
+    # memory stays flat for long calls.
+    slots = threading.BoundedSemaphore(max_workers * 2)
+
+    def run(batch):
+        # [(text, error, attempts)] per chunk. Digital silence, e.g. the
+        # other speaker's turns in a diarized track, is never sent to the engine.
+        results = [('', None, 0)] * len(batch)
+        pending = [i for i, segment in enumerate(batch) if segment.rms]
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            for i, (text, error) in zip(pending, backend.transcribe_batch([to_audio_data(batch[i]) for i in pending])):
+                results[i] = (text, error, attempt + 1)
+            pending = [i for i in pending if results[i][1]]
+        return results
+
+    def release(future):
+        slots.release()
+
+    batches = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stt') as pool:
+        def submit(batch):
+            slots.acquire()
+            future = pool.submit(run, [segment for _, _, segment in batch])
+            future.add_done_callback(release)
+            batches.append(([(start, end) for start, end, _ in batch], future))
+
+        batch = []
+        for chunk in iter_chunks(source):
+            batch.append(chunk)
+            if len(batch) >= backend.batch_size:
+                submit(batch)
+                batch = []
+        if batch:
+            submit(batch)
+
+    segments = []
+    for times, future in batches:
+        for (start, end), (text, error, attempts) in zip(times, future.result()):
+            segments.append({'start': round(start, 2), 'end': round(end, 2), 'text': text, 'error': error,
+                             'attempts': attempts})
+    return segments
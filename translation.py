@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+# Google Translate rejects requests of 5000 characters or more
+MAX_BATCH_CHARS = 4500
+BATCH_SEPARATOR = '\n'
+
+
+_detect = None
+_detect_lock = threading.Lock()
+
+
+def language_detector():
+    # langdetect's detect(), with its language profiles loaded. Loading them
+    # takes about 0.4 s and 60 MB, so it happens on the first detection
+    # rather than at import; a preloading server calls this before forking
+    # so that its workers share one copy.
+    global _detect
+    with _detect_lock:
+        if _detect is None:
+            from langdetect import DetectorFactory, detect
+            from langdetect.detector_factory import init_factory
+            # Make language detection deterministic so cached and fresh results agree
+            DetectorFactory.seed = 0
+            init_factory()
+            _detect = detect
+    return _detect
+
+
+class TranslationCache:
+    # In-memory LRU in front of a SQLite table, keyed by (sentence, source
+    # language). Language detections are cached the same way, under lang=''.
+    def __init__(self, db_path, max_memory_entries=10000, max_disk_entries=500000):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS translations (
+                sentence TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                value TEXT NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (sentence, lang)
+            )
+        ''')
+        self._execute('CREATE INDEX IF NOT EXISTS translations_used_at ON translations (used_at)')
+
+    def _execute(self, sql, params=()):
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+        if missing:
+            with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+                for sentence, lang in missing:
+                    row = conn.execute('SELECT value FROM translations WHERE sentence = ? AND lang = ?',
+                                       (sentence, lang)).fetchone()
+                    if row:
+                        found[(sentence, lang)] = row[0]
+                        conn.execute('UPDATE translations SET used_at = ? WHERE sentence = ? AND lang = ?',
+                                     (time.time(), sentence, lang))
+            for key in missing:
+                if key in found:
+                    self._remember(key, found[key])
+        return found
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO translations (sentence, lang, value, used_at) VALUES (?, ?, ?, ?)',
+                             [(sentence, lang, value, now) for (sentence, lang), value in items.items()])
+        for key, value in items.items():
+            self._remember(key, value)
+        with self._lock:
+            self._writes += len(items)
+            due = self._writes >= 1000
+            if due:
+                self._writes = 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        # Drop the least recently used rows once the table outgrows its limit
+        self._execute('''
+            DELETE FROM translations WHERE rowid IN (
+                SELECT rowid FROM translations ORDER BY used_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_disk_entries,))
+
+
+class FakeTranslatorClient:
+    # Offline stand-in for GoogleTranslator in benchmarks and load tests:
+    # returns the text unchanged after an optional simulated delay
+    def __init__(self, latency=None):
+        self.latency = float(latency if latency is not None else os.environ.get('FAKE_TRANSLATION_LATENCY', 0))
+
+    def translate(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return text
+
+
+def google_client():
+    from deep_translator import GoogleTranslator
+    return GoogleTranslator(source='auto', target='en')
+
+
+CLIENTS = {
+    'google': google_client,
+    'fake': FakeTranslatorClient,
+}
+
+
+class Translator:
+    # Detects the language of each sentence and translates the non-English
+    # ones to English, batching sentences of the same language into as few
+    # requests as possible and caching every result.
+    def __init__(self, cache, client='google'):
+        if client not in CLIENTS:
+            raise ValueError(f"Unknown translation client {client!r}, expected one of {', '.join(CLIENTS)}")
+        self.cache = cache
+        self._new_client = CLIENTS[client]
+        self._local = threading.local()
+        # Languages whose translations came back without their line breaks,
+        # which are sent a sentence at a time from then on
+        self.unbatched_languages = set()
+
+    @property
+    def client(self):
+        # The client keeps request state on itself, so each worker thread
+        # reuses its own instead of building one per sentence
+        if not hasattr(self._local, 'client'):
+            self._local.client = self._new_client()
+        return self._local.client
+
+    def detect_languages(self, sentences):
+        keys = [(sentence, '') for sentence in dict.fromkeys(sentences)]
+        found = self.cache.get_many(keys)
+        detected = {}
+        missing = [sentence for sentence, _ in keys if (sentence, '') not in found]
+        detect = language_detector() if missing else None
+        for sentence in missing:
+            try:
+                detected[(sentence, '')] = detect(sentence)
+            except Exception:
+                detected[(sentence, '')] = "unknown"
+        self.cache.put_many(detected)
+        found.update(detected)
+        return {sentence: found[(sentence, '')] for sentence, _ in keys}
+
+    def _translate_batch(self, batch, lang):
+        # Google Translate keeps line breaks, so a batch goes out as one request
+        # and is split back apart. Returns (translations, requests, failures)
+        # with None for sentences that couldn't be translated. A failed request
+        # isn't retried here: the job's translations aren't cached then, so
+        # the next upload of the call tries again.
+        try:
+            translated = self.client.translate(BATCH_SEPARATOR.join(batch))
+        except Exception:
+            return [None] * len(batch), 1, len(batch)
+        parts = translated.split(BATCH_SEPARATOR) if translated else []
+        if len(parts) == len(batch):
+            return [part.strip() for part in parts], 1, 0
+        if len(batch) == 1:
+            return [None], 1, 1
+        if len(parts) == 1:
+            # Every line break was dropped: batching can't work for this
+            # language, so its sentences go one at a time from now on
+            self.unbatched_languages.add(lang)
+            halves = [[sentence] for sentence in batch]
+        else:
+            # Some sentence threw the parts out of line; halving finds it in
+            # a few requests rather than one per sentence
+            halves = [batch[:len(batch) // 2], batch[len(batch) // 2:]]
+        results = []
+        requests, failures = 1, 0
+        for half in halves:
+            half_results, half_requests, half_failures = self._translate_batch(half, lang)
+            results += half_results
+            requests += half_requests
+            failures += half_failures
+        return results, requests, failures
+
+    def translate(self, sentences, stats=None):
+        # Returns [(sentence, lang, translation)] in the original order
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        languages = self.detect_languages(sentences)
+        stats['detect_seconds'] = round(time.perf_counter() - start, 4)
+
+        start = time.perf_counter()
+        wanted = [(sentence, lang) for sentence, lang in dict.fromkeys(
+            (sentence, languages[sentence]) for sentence in sentences) if lang != 'en']
+        cached = self.cache.get_many(wanted)
+        by_language = {}
+        for sentence, lang in wanted:
+            if (sentence, lang) not in cached:
+                by_language.setdefault(lang, []).append(sentence)
+
+        fresh = {}
+        requests = failures = 0
+        for lang, pending in by_language.items():
+            batch = []
+            size = 0
+            max_chars = 0 if lang in self.unbatched_languages else MAX_BATCH_CHARS
+            for sentence in pending + [None]:
+                if sentence is None or (batch and size + len(sentence) + 1 > max_chars):
+                    results, batch_requests, batch_failures = self._translate_batch(batch, lang)
+                    requests += batch_requests
+                    failures += batch_failures
+                    for original, translation in zip(batch, results):
+                        if translation is not None:
+                            fresh[(original, lang)] = translation
+                    batch = []
+                    size = 0
+                if sentence is not None:
+                    batch.append(sentence)
+                    size += len(sentence) + 1
+        self.cache.put_many(fresh)
+        translations = {**cached, **fresh}
+
+        stats.update(
+            sentences=len(sentences),
+            cache_hits=len(cached),
+            cache_misses=len(wanted) - len(cached),
+            cache_hit_ratio=round(len(cached) / len(wanted), 3) if wanted else 1.0,
+            translate_requests=requests,
+            translate_failures=failures,
+            translate_seconds=round(time.perf_counter() - start, 4),
+        )
+        return [
+            (sentence, languages[sentence],
+             sentence if languages[sentence] == 'en' else translations.get((sentence, languages[sentence]), sentence))
+            for sentence in sentences
+        ]
@@ -0,0 +1,5 @@
+# WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:application
+# (or uwsgi --module wsgi:application, which also loads it before forking)
+from app import create_app
+
+application = create_app(preload=True)